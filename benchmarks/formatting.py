@@ -0,0 +1,77 @@
+"""Measure how fast messages from IRC are formatted for Slack.
+
+    python -m benchmarks.formatting --messages 100000 --users 2000
+
+A batch of IRC messages (some with color codes, mentions of -slack nicks, and
+@channel) is run through format_slack_post, the same function the Slack post
+workers use, once with the Slack names in a set (as the bridge keeps them)
+and once in a list (the linear search through every user bot it used to do).
+The time per message and messages per second are reported for each.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any
+from typing import Collection
+
+from slackbridge.utils import format_slack_post
+
+
+def make_messages(count: int, names: list[str]) -> list[tuple[str, str]]:
+    rng = random.Random(0)
+    words = 'the bridge is up again thanks for fixing it lunch anyone'.split()
+    messages = []
+    for i in range(count):
+        text = ' '.join(rng.choices(words, k=rng.randint(3, 15)))
+        if i % 3 == 0:
+            text = f'{rng.choice(names)}-slack: {text}'
+        if i % 7 == 0:
+            text = f'\x0304,01{text}\x03'
+        if i % 50 == 0:
+            text += ' <!channel>'
+        messages.append((f'nick{i % 100}', text))
+    return messages
+
+
+def run(
+    messages: list[tuple[str, str]],
+    slack_names: Collection[str],
+) -> dict[str, Any]:
+    start = time.perf_counter()
+    for nick, text in messages:
+        format_slack_post(nick, '#general', text, slack_names)
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': round(elapsed, 3),
+        'us_per_message': round(elapsed / len(messages) * 1e6, 2),
+        'messages_per_second': round(len(messages) / elapsed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    names = [f'user{i}' for i in range(args.users)]
+    messages = make_messages(args.messages, names)
+    # Warm up first so that both runs start with the gravatar URLs cached
+    run(messages, set(names))
+    results: dict[str, Any] = {
+        'messages': args.messages,
+        'users': args.users,
+        'set': run(messages, set(names)),
+        'list': run(messages, names),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
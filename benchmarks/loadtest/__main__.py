@@ -0,0 +1,346 @@
+"""End to end load test of the bridge against local stand-ins for Slack/IRC.
+
+    python -m benchmarks.loadtest --users 500 --channels 50 --rate 20
+
+This starts a fake Slack (Web API and RTM websocket) and a fake IRC server in
+this process, then runs the bridge through slackbridge.main in a subprocess
+pointed at them. Once every bot has connected and joined its channels (the
+startup time), messages are sent both ways at the given rate, and throughput,
+latency, and the bridge's memory and CPU use are reported. Finally the bridge
+is sent SIGTERM, and how long it takes to shut down and how many bots sent a
+QUIT are reported too.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from twisted.internet import reactor
+from twisted.internet import ssl
+from twisted.internet.task import LoopingCall
+from twisted.web.server import Site
+
+from benchmarks.loadtest.certs import make_self_signed_cert
+from benchmarks.loadtest.fake_irc import FakeIRCServer
+from benchmarks.loadtest.fake_slack import FakeSlack
+from benchmarks.loadtest.fake_slack import RTMFactory
+from benchmarks.loadtest.fake_slack import SlackAPI
+
+# Seconds to wait for the bridge to exit after sending it SIGTERM, a bit more
+# than its default [shutdown] deadline
+SHUTDOWN_TIMEOUT = 30
+
+CONFIG = '''
+[irc]
+nickserv_pass=loadtest
+host=localhost
+port={irc_port}
+ca_file={ca_file}
+
+[slack]
+token=xoxb-loadtest
+user=UBRIDGE
+
+[health]
+port=0
+
+[logging]
+level=warn
+'''
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[round(p * (len(values) - 1))]
+
+
+def process_stats(pid: int) -> dict[str, float]:
+    """Resident memory (in MiB) and CPU time used so far by a process"""
+    with open(f'/proc/{pid}/status') as f:
+        rss_kb = next(
+            int(line.split()[1]) for line in f if line.startswith('VmRSS:')
+        )
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    return {
+        'rss_mib': rss_kb / 1024,
+        'cpu_seconds': (int(fields[11]) + int(fields[12])) / ticks,
+    }
+
+
+def make_workspace(
+    num_users: int,
+    num_channels: int,
+    members: int,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    users = [
+        {
+            'id': f'U{i:08d}',
+            'name': f'user{i}',
+            'real_name': f'Load User {i}',
+            'is_bot': False,
+            'deleted': False,
+            'profile': {},
+        }
+        for i in range(num_users)
+    ]
+    user_ids = [user['id'] for user in users]
+    channels = []
+    for i in range(num_channels):
+        chosen = random.sample(user_ids, min(members, len(user_ids)))
+        channels.append({
+            'id': f'C{i:08d}',
+            'name': f'chan{i}',
+            'topic': {'value': ''},
+            'num_members': len(chosen),
+            'members': chosen,
+        })
+    return users, channels
+
+
+class LoadTest:
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.users, self.channels = make_workspace(
+            args.users,
+            args.channels,
+            args.members,
+        )
+        self.expected_joins = len(self.channels) + sum(
+            len(channel['members']) for channel in self.channels
+        )
+
+        self.slack = FakeSlack(self.users, self.channels, self.on_slack_post)
+        self.irc = FakeIRCServer(self.on_irc_message)
+
+        self.seq = 0
+        self.sent: dict[str, float] = {}
+        self.latencies: dict[str, list[float]] = {
+            'slack->irc': [],
+            'irc->slack': [],
+        }
+        self.results: dict[str, Any] = {}
+        self.process: subprocess.Popen[bytes] | None = None
+
+    def on_irc_message(self, nick: str, channel: str, text: str) -> None:
+        if text.startswith('slack-') and text in self.sent:
+            self.latencies['slack->irc'].append(
+                time.monotonic() - self.sent.pop(text),
+            )
+
+    def on_slack_post(self, channel: str, text: str, username: str) -> None:
+        if text.startswith('irc-') and text in self.sent:
+            self.latencies['irc->slack'].append(
+                time.monotonic() - self.sent.pop(text),
+            )
+
+    def start(self, tmpdir: str) -> None:
+        cert_path, key_path = make_self_signed_cert(tmpdir)
+        context = ssl.DefaultOpenSSLContextFactory(key_path, cert_path)
+
+        irc_port = reactor.listenSSL(
+            0, self.irc, context, interface='127.0.0.1',
+        ).getHost().port
+        api_port = reactor.listenSSL(
+            0, Site(SlackAPI(self.slack)), context, interface='127.0.0.1',
+        ).getHost().port
+        ws_port = reactor.listenSSL(
+            0, RTMFactory(self.slack), context, interface='127.0.0.1',
+        ).getHost().port
+        self.slack.websocket_url = f'wss://localhost:{ws_port}/'
+
+        config_path = os.path.join(tmpdir, 'slackbridge.conf')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(irc_port=irc_port, ca_file=cert_path))
+
+        env = dict(
+            os.environ,
+            FAKE_SLACK_DOMAIN=f'localhost:{api_port}',
+            REQUESTS_CA_BUNDLE=cert_path,
+            WEBSOCKET_CLIENT_CA_BUNDLE=cert_path,
+        )
+        self.log_path = os.path.join(tmpdir, 'bridge.log')
+        self.started_at = time.monotonic()
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'benchmarks.loadtest.bridge',
+                '-c', config_path,
+            ],
+            env=env,
+            stdout=open(self.log_path, 'wb'),
+            stderr=subprocess.STDOUT,
+        )
+
+        self.startup_loop = LoopingCall(self.check_startup)
+        self.startup_loop.start(0.1)
+
+    def check_startup(self) -> None:
+        assert self.process is not None
+        elapsed = time.monotonic() - self.started_at
+        if self.process.poll() is not None:
+            self.fail(f'Bridge exited with {self.process.returncode}')
+        elif elapsed > self.args.startup_timeout:
+            self.fail(
+                'Timed out starting up ({} of {} bots, {} of {} joins)'.format(
+                    self.irc.registered,
+                    len(self.users) + 1,
+                    self.irc.joins,
+                    self.expected_joins,
+                ),
+            )
+        elif (
+            self.irc.registered >= len(self.users) + 1 and
+            self.irc.joins >= self.expected_joins and
+            self.slack.websockets
+        ):
+            self.startup_loop.stop()
+            self.results['startup_seconds'] = round(elapsed, 2)
+            self.results['after_startup'] = process_stats(self.process.pid)
+            self.start_workload()
+
+    def start_workload(self) -> None:
+        self.workload_started = time.monotonic()
+        self.send_loop = LoopingCall(self.send_messages)
+        self.send_loop.start(1 / self.args.rate)
+        reactor.callLater(self.args.duration, self.stop_workload)
+
+    def send_messages(self) -> None:
+        """Send one message from Slack to IRC and one from IRC to Slack"""
+        channel = random.choice(self.channels)
+        if channel['members']:
+            tag = f'slack-{self.seq}'
+            self.sent[tag] = time.monotonic()
+            self.slack.send_event({
+                'type': 'message',
+                'channel': channel['id'],
+                'user': random.choice(channel['members']),
+                'text': tag,
+                'ts': f'{time.time():.6f}',
+            })
+
+        tag = f'irc-{self.seq}'
+        self.sent[tag] = time.monotonic()
+        self.irc.inject('loaduser', '#' + channel['name'], tag)
+        self.seq += 1
+
+    def stop_workload(self) -> None:
+        self.send_loop.stop()
+        # Give the bridge some time to deliver anything still in flight
+        reactor.callLater(self.args.drain, self.finish)
+
+    def finish(self) -> None:
+        assert self.process is not None
+        duration = self.args.duration
+        self.results['at_end'] = process_stats(self.process.pid)
+        self.results['cpu_seconds_under_load'] = round(
+            self.results['at_end']['cpu_seconds'] -
+            self.results['after_startup']['cpu_seconds'],
+            2,
+        )
+        for direction, latencies in self.latencies.items():
+            self.results[direction] = {
+                'sent': self.seq,
+                'delivered': len(latencies),
+                'throughput_per_second': round(len(latencies) / duration, 2),
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            }
+        self.results['slack_api_calls'] = self.slack.calls
+        self.results['irc_lines_received'] = self.irc.lines_received
+        self.stop()
+
+    def fail(self, reason: str) -> None:
+        self.results['error'] = reason
+        with open(self.log_path, errors='replace') as f:
+            self.results['bridge_log_tail'] = f.readlines()[-40:]
+        self.stop()
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            reactor.stop()
+            return
+
+        # Wait for the bridge to shut down without blocking, so that the fake
+        # servers can see it send its QUITs
+        self.process.terminate()
+        self.stopping_at = time.monotonic()
+        self.stop_loop = LoopingCall(self.check_stopped)
+        self.stop_loop.start(0.1)
+
+    def check_stopped(self) -> None:
+        assert self.process is not None
+        elapsed = time.monotonic() - self.stopping_at
+        if self.process.poll() is None and elapsed < SHUTDOWN_TIMEOUT:
+            return
+
+        self.stop_loop.stop()
+        if self.process.poll() is None:
+            self.process.kill()
+            self.results['shutdown'] = {'error': 'Timed out'}
+        else:
+            self.results['shutdown'] = {
+                'seconds': round(elapsed, 2),
+                'quits': self.irc.quits,
+            }
+        reactor.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument(
+        '--members',
+        type=int,
+        default=20,
+        help='Number of members in each channel',
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=10,
+        help='Messages per second to send in each direction',
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=30,
+        help='Seconds to send messages for',
+    )
+    parser.add_argument(
+        '--drain',
+        type=float,
+        default=5,
+        help='Seconds to wait for in-flight messages after sending stops',
+    )
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    load_test = LoadTest(args)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reactor.callWhenRunning(load_test.start, tmpdir)
+        reactor.run()
+        print(json.dumps(load_test.results, indent=2))
+
+    if 'error' in load_test.results:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Runs slackbridge.main pointed at the fake Slack server from the load test.
+
+slackclient always sends Web API calls to slack.com, so the domain is swapped
+out for the one in $FAKE_SLACK_DOMAIN. Certificates are trusted through
+$REQUESTS_CA_BUNDLE and $WEBSOCKET_CLIENT_CA_BUNDLE, which the load test sets.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any
+
+from slackclient.slackrequest import SlackRequest
+
+from slackbridge.main import main
+
+_do = SlackRequest.do
+
+
+def do_fake(
+    self: SlackRequest,
+    token: str | None = None,
+    request: str = '?',
+    post_data: Any = None,
+    domain: str = 'slack.com',
+    timeout: float | None = None,
+) -> Any:
+    domain = os.environ['FAKE_SLACK_DOMAIN']
+    return _do(self, token, request, post_data, domain, timeout)
+
+
+SlackRequest.do = do_fake
+
+if __name__ == '__main__':
+    main()
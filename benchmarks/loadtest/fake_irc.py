@@ -0,0 +1,188 @@
+"""A minimal IRC server, just enough for the bridge's bots to register, join
+channels, identify with NickServ, WHOIS, go away, and talk to each other."""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Callable
+
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+
+SERVER_NAME = 'fake-irc.localhost'
+
+# Commands from clients that make up the transcript of what the bridge did
+TRANSCRIPT_COMMANDS = {'PRIVMSG', 'NOTICE', 'JOIN', 'PART', 'AWAY', 'TOPIC'}
+
+
+class IRCConnection(LineReceiver):
+    delimiter = b'\r\n'
+    MAX_LENGTH = 4096
+
+    def __init__(self, server: FakeIRCServer):
+        self.server = server
+        self.nick: str | None = None
+        self.user: str | None = None
+        self.registered = False
+        self.channels: set[str] = set()
+
+    @property
+    def prefix(self) -> str:
+        return f'{self.nick}!{self.user}@localhost'
+
+    def send(self, prefix: str, command: str, *params: str) -> None:
+        line = f':{prefix} {command}'
+        if params:
+            line += ' ' + ' '.join(params[:-1] + (':' + params[-1],))
+        self.sendLine(line.encode())
+
+    def reply(self, command: str, *params: str) -> None:
+        self.send(SERVER_NAME, command, self.nick or '*', *params)
+
+    def lineReceived(self, line: bytes) -> None:
+        self.server.lines_received += 1
+        text = line.decode(errors='replace')
+        if text.startswith(':'):
+            text = text.split(' ', 1)[1]
+        if ' :' in text:
+            middle, trailing = text.split(' :', 1)
+            params = middle.split() + [trailing]
+        else:
+            params = text.split()
+        if not params:
+            return
+
+        command = params[0].upper()
+        if command == 'QUIT':
+            self.server.quits += 1
+        if (
+            self.server.transcript is not None and
+            self.registered and
+            command in TRANSCRIPT_COMMANDS and
+            params[1:2] != ['NickServ']
+        ):
+            self.server.transcript.append(f'{self.nick} {text}')
+
+        handler = getattr(self, 'irc_' + command, None)
+        if handler is not None:
+            handler(*params[1:])
+
+    def connectionLost(self, reason: object) -> None:
+        self.irc_QUIT()
+
+    def irc_NICK(self, nick: str, *args: str) -> None:
+        if nick in self.server.clients:
+            self.reply('433', nick, 'Nickname is already in use')
+            return
+
+        if self.nick is not None:
+            self.server.clients.pop(self.nick, None)
+            if self.registered:
+                self.send(self.prefix, 'NICK', nick)
+        self.nick = nick
+        self.server.clients[nick] = self
+        self._maybe_register()
+
+    def irc_USER(self, user: str, *args: str) -> None:
+        self.user = user
+        self._maybe_register()
+
+    def _maybe_register(self) -> None:
+        if not self.registered and self.nick and self.user:
+            self.registered = True
+            self.server.registered += 1
+            self.reply('001', 'Welcome to the fake IRC network')
+
+    def irc_PING(self, *args: str) -> None:
+        self.send(SERVER_NAME, 'PONG', SERVER_NAME, *args)
+
+    def irc_JOIN(self, channels: str, *args: str) -> None:
+        for channel in channels.split(','):
+            self.channels.add(channel)
+            self.server.channels[channel].add(self)
+            self.server.joins += 1
+            for member in self.server.channels[channel]:
+                member.send(self.prefix, 'JOIN', channel)
+
+    def irc_PART(self, channels: str, *args: str) -> None:
+        for channel in channels.split(','):
+            for member in self.server.channels[channel]:
+                member.send(self.prefix, 'PART', channel)
+            self.channels.discard(channel)
+            self.server.channels[channel].discard(self)
+
+    def irc_PRIVMSG(self, target: str, text: str) -> None:
+        self.server.deliver(self, target, text)
+
+    def irc_NOTICE(self, target: str, text: str) -> None:
+        self.server.deliver(self, target, text, command='NOTICE')
+
+    def irc_WHOIS(self, nick: str, *args: str) -> None:
+        if nick in self.server.clients:
+            self.reply('311', nick, nick, 'localhost', '*', nick)
+            self.reply('330', nick, nick, 'is logged in as')
+        self.reply('318', nick, 'End of /WHOIS list.')
+
+    def irc_AWAY(self, *args: str) -> None:
+        if args and args[0]:
+            self.reply('306', 'You have been marked as being away')
+        else:
+            self.reply('305', 'You are no longer marked as being away')
+
+    def irc_QUIT(self, *args: str) -> None:
+        if self.nick is not None:
+            for channel in self.channels:
+                self.server.channels[channel].discard(self)
+            if self.server.clients.get(self.nick) is self:
+                del self.server.clients[self.nick]
+            self.nick = None
+        if self.transport is not None:
+            self.transport.loseConnection()
+
+
+class FakeIRCServer(Factory):
+    """Keeps track of connected clients and channels, and calls on_message
+    for every message sent to a channel so the load test can time them.
+
+    If record_transcript is set, every message, join, part, and away from a
+    registered client is kept in transcript so that runs can be compared.
+    """
+
+    def __init__(
+        self,
+        on_message: Callable[[str, str, str], None] | None = None,
+        record_transcript: bool = False,
+    ):
+        self.on_message = on_message
+        self.transcript: list[str] | None = [] if record_transcript else None
+        self.clients: dict[str, IRCConnection] = {}
+        self.channels: dict[str, set[IRCConnection]] = defaultdict(set)
+        self.registered = 0
+        self.joins = 0
+        self.lines_received = 0
+        self.quits = 0
+
+    def buildProtocol(self, addr: object) -> IRCConnection:
+        return IRCConnection(self)
+
+    def deliver(
+        self,
+        sender: IRCConnection,
+        target: str,
+        text: str,
+        command: str = 'PRIVMSG',
+    ) -> None:
+        if target.startswith('#'):
+            for member in self.channels[target]:
+                if member is not sender:
+                    member.send(sender.prefix, command, target, text)
+            if self.on_message is not None and sender.nick is not None:
+                self.on_message(sender.nick, target, text)
+        elif target in self.clients:
+            self.clients[target].send(sender.prefix, command, target, text)
+
+    def inject(self, nick: str, channel: str, text: str) -> None:
+        """Send a message to a channel as if from an IRC user that isn't
+        actually connected"""
+        prefix = f'{nick}!{nick}@localhost'
+        for member in self.channels[channel]:
+            member.send(prefix, 'PRIVMSG', channel, text)
@@ -0,0 +1,208 @@
+"""A stand-in for the Slack Web and RTM APIs, serving only the methods the
+bridge calls and a websocket that the load test can push RTM events into."""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import struct
+import time
+from typing import Any
+from typing import Callable
+
+from twisted.internet.protocol import Factory
+from twisted.internet.protocol import Protocol
+from twisted.web.resource import Resource
+from twisted.web.server import Request
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class SlackAPI(Resource):
+    """Handles POST /api/<method> like https://slack.com/api/<method>"""
+    isLeaf = True
+
+    def __init__(self, slack: FakeSlack):
+        super().__init__()
+        self.slack = slack
+
+    def render_POST(self, request: Request) -> bytes:
+        method = request.postpath[-1].decode()
+        args = {
+            key.decode(): values[0].decode()
+            for key, values in (request.args or {}).items()
+        }
+        self.slack.calls[method] = self.slack.calls.get(method, 0) + 1
+
+        handler = getattr(
+            self.slack,
+            'api_' + method.replace('.', '_'),
+            None,
+        )
+        if handler is None:
+            response = {'ok': False, 'error': 'unknown_method'}
+        else:
+            response = handler(args)
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(response).encode()
+
+
+class RTMProtocol(Protocol):
+    """The server side of just enough of RFC 6455 to send text frames"""
+
+    def __init__(self, slack: FakeSlack):
+        self.slack = slack
+        self.buffer = b''
+        self.open = False
+
+    def dataReceived(self, data: bytes) -> None:
+        if self.open:
+            # Client frames (pings, closes) aren't needed, just drop them
+            return
+
+        self.buffer += data
+        if b'\r\n\r\n' not in self.buffer:
+            return
+
+        headers = {}
+        for line in self.buffer.split(b'\r\n')[1:]:
+            if b':' in line:
+                name, value = line.split(b':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(
+            hashlib.sha1(headers[b'sec-websocket-key'] + WEBSOCKET_GUID)
+            .digest(),
+        )
+        assert self.transport is not None
+        self.transport.write(
+            b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: websocket\r\n'
+            b'Connection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n',
+        )
+        self.open = True
+        self.slack.websockets.add(self)
+        self.send_event({'type': 'hello'})
+
+    def connectionLost(self, reason: object) -> None:
+        self.slack.websockets.discard(self)
+
+    def send_event(self, event: dict[str, Any]) -> None:
+        payload = json.dumps(event).encode()
+        if len(payload) < 126:
+            header = struct.pack('!BB', 0x81, len(payload))
+        elif len(payload) < 2 ** 16:
+            header = struct.pack('!BBH', 0x81, 126, len(payload))
+        else:
+            header = struct.pack('!BBQ', 0x81, 127, len(payload))
+        assert self.transport is not None
+        self.transport.write(header + payload)
+
+
+class RTMFactory(Factory):
+
+    def __init__(self, slack: FakeSlack):
+        self.slack = slack
+
+    def buildProtocol(self, addr: object) -> RTMProtocol:
+        return RTMProtocol(self.slack)
+
+
+class FakeSlack:
+    """Holds the workspace (users, channels) and what has been posted.
+
+    on_post is called with the channel, text, and username of every
+    chat.postMessage call so that the load test can time them. Like Slack,
+    posted messages are also sent back over RTM as bot messages.
+    """
+
+    def __init__(
+        self,
+        users: list[dict[str, Any]],
+        channels: list[dict[str, Any]],
+        on_post: Callable[[str, str, str], None] | None = None,
+    ):
+        self.users = users
+        self.channels = channels
+        self.on_post = on_post
+        self.websocket_url = ''
+        self.websockets: set[RTMProtocol] = set()
+        self.calls: dict[str, int] = {}
+        self.posted = 0
+
+    def send_event(self, event: dict[str, Any]) -> None:
+        for websocket in self.websockets:
+            websocket.send_event(event)
+
+    def api_rtm_connect(self, args: dict[str, str]) -> dict[str, Any]:
+        return {
+            'ok': True,
+            'url': self.websocket_url,
+            'team': {'id': 'T0AAAAAAA', 'name': 'Load', 'domain': 'load'},
+            'self': {'id': 'UBRIDGE', 'name': 'slack-bridge'},
+        }
+
+    def api_conversations_list(self, args: dict[str, str]) -> dict[str, Any]:
+        if args.get('types') == 'im':
+            return {
+                'ok': True,
+                'channels': [
+                    {'id': 'D' + user['id'], 'user': user['id'], 'is_im': True}
+                    for user in self.users
+                ],
+                'response_metadata': {'next_cursor': ''},
+            }
+        return {
+            'ok': True,
+            'channels': [
+                {
+                    key: value
+                    for key, value in channel.items()
+                    if key != 'members'
+                }
+                for channel in self.channels
+            ],
+            'response_metadata': {'next_cursor': ''},
+        }
+
+    def api_conversations_members(
+        self,
+        args: dict[str, str],
+    ) -> dict[str, Any]:
+        channel = next(c for c in self.channels if c['id'] == args['channel'])
+        start = int(args.get('cursor') or 0)
+        end = start + int(args.get('limit', 100))
+        more = end < len(channel['members'])
+        return {
+            'ok': True,
+            'members': channel['members'][start:end],
+            'response_metadata': {'next_cursor': str(end) if more else ''},
+        }
+
+    def api_users_list(self, args: dict[str, str]) -> dict[str, Any]:
+        return {'ok': True, 'members': self.users}
+
+    def api_conversations_open(self, args: dict[str, str]) -> dict[str, Any]:
+        return {'ok': True, 'channel': {'id': 'D' + args['users']}}
+
+    def api_conversations_setTopic(
+        self,
+        args: dict[str, str],
+    ) -> dict[str, Any]:
+        return {'ok': True}
+
+    def api_chat_postMessage(self, args: dict[str, str]) -> dict[str, Any]:
+        if self.on_post is not None:
+            self.on_post(args['channel'], args['text'], args['username'])
+        self.posted += 1
+        ts = f'{time.time():.0f}.{self.posted:06d}'
+        self.send_event({
+            'type': 'message',
+            'subtype': 'bot_message',
+            'bot_id': 'BBRIDGE',
+            'username': args['username'],
+            'channel': args['channel'],
+            'text': args['text'],
+            'ts': ts,
+        })
+        return {'ok': True, 'channel': args['channel'], 'ts': ts}
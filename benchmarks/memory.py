@@ -0,0 +1,238 @@
+"""Measure how much memory the bridge's long-lived Slack state takes up.
+
+This builds synthetic users.list and conversations.list payloads shaped like
+the real ones from Slack, then compares keeping the raw objects around (how
+the bridge used to store them) with the trimmed, slotted records it uses now.
+
+    python -m benchmarks.memory --users 5000 --channels 500
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import string
+import tracemalloc
+from typing import Any
+from typing import Callable
+
+from slackbridge.messages import SlackMessage
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+
+
+def random_id(prefix: str) -> str:
+    return prefix + ''.join(
+        random.choices(string.ascii_uppercase + string.digits, k=10),
+    )
+
+
+def fake_user(user_id: str) -> dict[str, Any]:
+    name = ''.join(random.choices(string.ascii_lowercase, k=8))
+    return {
+        'id': user_id,
+        'team_id': 'T0AAAAAAA',
+        'name': name,
+        'deleted': False,
+        'color': '9f69e7',
+        'real_name': name.title() + ' ' + name[::-1].title(),
+        'tz': 'America/Los_Angeles',
+        'tz_label': 'Pacific Daylight Time',
+        'tz_offset': -25200,
+        'profile': {
+            'title': '',
+            'phone': '',
+            'skype': '',
+            'real_name': name.title(),
+            'real_name_normalized': name.title(),
+            'display_name': name,
+            'display_name_normalized': name,
+            'status_text': '',
+            'status_emoji': '',
+            'avatar_hash': 'g' + 'a' * 11,
+            'email': f'{name}@ocf.berkeley.edu',
+            'image_24': f'https://secure.gravatar.com/avatar/{name}-24.png',
+            'image_32': f'https://secure.gravatar.com/avatar/{name}-32.png',
+            'image_48': f'https://secure.gravatar.com/avatar/{name}-48.png',
+            'image_72': f'https://secure.gravatar.com/avatar/{name}-72.png',
+            'image_192': f'https://secure.gravatar.com/avatar/{name}-192.png',
+            'image_512': f'https://secure.gravatar.com/avatar/{name}-512.png',
+            'team': 'T0AAAAAAA',
+        },
+        'is_admin': False,
+        'is_owner': False,
+        'is_primary_owner': False,
+        'is_restricted': False,
+        'is_ultra_restricted': False,
+        'is_bot': False,
+        'is_app_user': False,
+        'updated': 1500000000,
+    }
+
+
+def fake_channel(
+    channel_id: str,
+    user_ids: list[str],
+    members: int,
+) -> dict[str, Any]:
+    name = ''.join(random.choices(string.ascii_lowercase, k=10))
+    chosen = random.sample(user_ids, min(members, len(user_ids)))
+    return {
+        'id': channel_id,
+        'name': name,
+        'is_channel': True,
+        'is_group': False,
+        'is_im': False,
+        'created': 1449252889,
+        'creator': user_ids[0],
+        'is_archived': False,
+        'is_general': False,
+        'unlinked': 0,
+        'name_normalized': name,
+        'is_shared': False,
+        'is_ext_shared': False,
+        'is_org_shared': False,
+        'pending_shared': [],
+        'is_pending_ext_shared': False,
+        'is_member': True,
+        'is_private': False,
+        'is_mpim': False,
+        'topic': {
+            'value': f'Welcome to #{name}!',
+            'creator': user_ids[0],
+            'last_set': 1449709364,
+        },
+        'purpose': {
+            'value': f'Discussion about {name}',
+            'creator': user_ids[0],
+            'last_set': 1449709364,
+        },
+        'previous_names': [],
+        'num_members': len(chosen),
+        'members': chosen,
+    }
+
+
+def fake_message(channel_id: str, user_id: str) -> dict[str, Any]:
+    return {
+        'client_msg_id': random_id('m'),
+        'suppress_notification': False,
+        'type': 'message',
+        'text': 'a message of some average length for a chat channel',
+        'user': user_id,
+        'team': 'T0AAAAAAA',
+        'user_team': 'T0AAAAAAA',
+        'source_team': 'T0AAAAAAA',
+        'channel': channel_id,
+        'event_ts': '1500000000.000100',
+        'ts': '1500000000.000100',
+        'blocks': [{
+            'type': 'rich_text',
+            'block_id': 'abc',
+            'elements': [{
+                'type': 'rich_text_section',
+                'elements': [{'type': 'text', 'text': 'a message'}],
+            }],
+        }],
+    }
+
+
+def measure(build: Callable[[], Any]) -> tuple[int, Any]:
+    """Return the number of bytes still allocated by build() once it's done,
+    along with whatever it built so that it stays alive while measuring"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--channels', type=int, default=500)
+    parser.add_argument(
+        '--members',
+        type=int,
+        default=100,
+        help='Average number of members per channel',
+    )
+    parser.add_argument('--messages', type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    user_ids = [random_id('U') for _ in range(args.users)]
+    users = [fake_user(user_id) for user_id in user_ids]
+    channels = [
+        fake_channel(
+            random_id('C'),
+            user_ids,
+            random.randint(1, args.members * 2),
+        )
+        for _ in range(args.channels)
+    ]
+    messages = [
+        fake_message(random.choice(channels)['id'], random.choice(user_ids))
+        for _ in range(args.messages)
+    ]
+
+    # Everything is decoded from JSON inside the measurement, like it would be
+    # when coming from the Slack API, so that no strings are shared with the
+    # payloads generated above
+    users_json = json.dumps(users)
+    channels_json = json.dumps(channels)
+    messages_json = [json.dumps(message) for message in messages]
+
+    def raw_state() -> Any:
+        return (
+            json.loads(users_json),
+            {
+                channel['id']: channel
+                for channel in json.loads(channels_json)
+            },
+        )
+
+    def record_state() -> Any:
+        return (
+            [SlackUser.from_dict(user) for user in json.loads(users_json)],
+            {
+                channel['id']: SlackChannel.from_dict(channel)
+                for channel in json.loads(channels_json)
+            },
+        )
+
+    def raw_messages() -> Any:
+        return [json.loads(message) for message in messages_json]
+
+    def slotted_messages() -> Any:
+        return [
+            SlackMessage(json.loads(message), None)  # type: ignore
+            for message in messages_json
+        ]
+
+    rows = [
+        ('users + channels', raw_state, record_state),
+        ('queued messages', raw_messages, slotted_messages),
+    ]
+    print(
+        f'{args.users} users, {args.channels} channels, '
+        f'{args.messages} messages',
+    )
+    for name, before, after in rows:
+        before_size, _ = measure(before)
+        after_size, _ = measure(after)
+        print(
+            '{:<18} before: {:>8.1f} KiB  after: {:>8.1f} KiB ({:.0%})'.format(
+                name,
+                before_size / 1024,
+                after_size / 1024,
+                after_size / before_size,
+            ),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Replay a capture made with --capture-rtm through the bridge.
+
+    python -m benchmarks.replay capture.ndjson.gz --speed fast -o irc.txt
+
+The bridge runs in this process against the fake IRC server from the load
+test, with a stand-in Slack client that hands the captured frames to
+BridgeBot.check_slack_rtm either as fast as possible or at the speed they
+were recorded. Web API calls are answered locally without going anywhere.
+
+A summary of CPU time, wall time, and the timings of the bridge's hot paths
+is printed, and the transcript of everything the bots sent to IRC can be
+written out to compare the output of different builds with diff.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from collections import Counter
+from typing import Any
+from typing import Iterator
+
+from twisted.internet import reactor
+from twisted.internet import ssl
+from twisted.internet.task import LoopingCall
+
+import slackbridge.metrics as metrics
+from benchmarks.loadtest.certs import make_self_signed_cert
+from benchmarks.loadtest.fake_irc import FakeIRCServer
+from slackbridge.bots import BridgeBot
+from slackbridge.bridge import Bridge
+from slackbridge.capture import read_capture
+from slackbridge.factories import BridgeBotFactory
+from slackbridge.history import MessageIndex
+from slackbridge.presence import PresenceManager
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+from slackbridge.tls import SharedClientTLS
+
+BRIDGE_UID = 'UREPLAY'
+
+# How many frames to hand to the bridge at once when replaying at full speed
+FAST_BATCH = 100
+
+
+class ReplaySlackClient:
+    """Stands in for SlackClient. rtm_read() returns whatever frames the
+    replay has made available, and Web API calls are just counted."""
+
+    def __init__(self) -> None:
+        self.frames: list[dict[str, Any]] = []
+        self.api_calls: Counter[str] = Counter()
+
+    def rtm_connect(self, **kwargs: Any) -> bool:
+        return True
+
+    def rtm_read(self) -> list[dict[str, Any]]:
+        frames, self.frames = self.frames, []
+        return frames
+
+    def api_call(self, method: str, **kwargs: Any) -> dict[str, Any]:
+        self.api_calls[method] += 1
+        if method == 'conversations.open':
+            return {'ok': True, 'channel': {'id': 'D' + kwargs['users']}}
+        return {'ok': True, 'ts': '0.0'}
+
+
+class Replay:
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.header, self.events = read_capture(args.capture)
+        self.users = [SlackUser.from_dict(u) for u in self.header['users']]
+        self.channels = [
+            SlackChannel.from_dict(c) for c in self.header['channels']
+        ]
+        user_ids = {user.id for user in self.users}
+        self.expected_joins = len(self.channels) + sum(
+            len(channel.members & user_ids) for channel in self.channels
+        )
+
+        self.sc = ReplaySlackClient()
+        self.irc = FakeIRCServer(record_transcript=True)
+        self.replayed = 0
+        self.max_lag = 0.0
+        self.results: dict[str, Any] = {}
+
+    def start(self, tmpdir: str) -> None:
+        cert_path, key_path = make_self_signed_cert(tmpdir)
+        context = ssl.DefaultOpenSSLContextFactory(key_path, cert_path)
+        irc_port = reactor.listenSSL(
+            0, self.irc, context, interface='127.0.0.1',
+        ).getHost().port
+
+        # Presence changes are sent right away so the transcript doesn't
+        # depend on how long the replay takes
+        self.bridge = Bridge(self.sc, 'replay', BRIDGE_UID)
+        presence = PresenceManager(
+            self.bridge.users, window=0, rate=10 ** 6,
+        )
+        factory = BridgeBotFactory(
+            self.bridge, 'slack-bridge', 'replay',
+            self.channels, self.users, presence, MessageIndex(),
+            'localhost', irc_port,
+            SharedClientTLS.from_ca_file('localhost', cert_path),
+        )
+        reactor.connectSSL('localhost', irc_port, factory, factory.tls)
+
+        self.started_at = time.monotonic()
+        self.startup_loop = LoopingCall(self.check_startup)
+        self.startup_loop.start(0.1)
+
+    def check_startup(self) -> None:
+        if (
+            self.irc.registered >= len(self.users) + 1 and
+            self.irc.joins >= self.expected_joins
+        ):
+            self.startup_loop.stop()
+            self.results['startup_seconds'] = round(
+                time.monotonic() - self.started_at, 2,
+            )
+            # Only count what happens during the replay itself
+            self.irc.transcript = []
+            for timing in metrics.timings.values():
+                timing.reset()
+            self.begin()
+
+    def begin(self) -> None:
+        self.bridge_bot: BridgeBot = self.bridge.bots[BRIDGE_UID]
+        self.wall_start = time.monotonic()
+        self.cpu_start = time.process_time()
+        self.pending: Iterator[tuple[float, dict[str, Any]]] = self.events
+        self.next_event = next(self.pending, None)
+        self.first_offset = self.next_event[0] if self.next_event else 0
+        self.feed()
+
+    def feed(self) -> None:
+        elapsed = time.monotonic() - self.wall_start
+        while self.next_event is not None:
+            offset, event = self.next_event
+            due = offset - self.first_offset
+            if self.args.speed == 'fast':
+                if len(self.sc.frames) >= FAST_BATCH:
+                    break
+            elif due > elapsed:
+                break
+            else:
+                self.max_lag = max(self.max_lag, elapsed - due)
+            self.sc.frames.append(event)
+            self.replayed += 1
+            self.next_event = next(self.pending, None)
+
+        self.bridge_bot.check_slack_rtm()
+        self.bridge_bot.empty_queue()
+
+        if self.next_event is None:
+            self.results['replay_seconds'] = round(
+                time.monotonic() - self.wall_start, 3,
+            )
+            # Let the bots finish writing to IRC before wrapping up
+            reactor.callLater(self.args.drain, self.finish)
+        elif self.args.speed == 'fast':
+            reactor.callLater(0, self.feed)
+        else:
+            due = self.next_event[0] - self.first_offset
+            delay = due - (time.monotonic() - self.wall_start)
+            reactor.callLater(max(0, delay), self.feed)
+
+    def finish(self) -> None:
+        replay_seconds = self.results['replay_seconds']
+        self.results.update({
+            'events': self.replayed,
+            'events_per_second': round(
+                self.replayed / max(replay_seconds, 1e-9), 1,
+            ),
+            'cpu_seconds': round(time.process_time() - self.cpu_start, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'irc_lines': len(self.irc.transcript or []),
+            'slack_api_calls': dict(self.sc.api_calls),
+            **metrics.snapshot(),
+        })
+
+        if self.args.output:
+            # Lines from different bots (and presence changes vs. messages)
+            # can arrive in a different order depending on timing, so sort
+            # them to be able to diff the output of two runs
+            transcript = sorted(self.irc.transcript or [])
+            with open(self.args.output, 'w') as f:
+                f.writelines(line + '\n' for line in transcript)
+        reactor.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('capture', help='Capture file from --capture-rtm')
+    parser.add_argument(
+        '--speed',
+        choices=('fast', 'recorded'),
+        default='fast',
+        help='Replay as fast as possible or with the recorded timing',
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Write what was sent to IRC to this file',
+    )
+    parser.add_argument(
+        '--drain',
+        type=float,
+        default=2,
+        help='Seconds to wait for output after the last event',
+    )
+    args = parser.parse_args()
+
+    replay = Replay(args)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reactor.callWhenRunning(replay.start, tmpdir)
+        reactor.run()
+    print(json.dumps(replay.results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
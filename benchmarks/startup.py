@@ -0,0 +1,111 @@
+"""Measure how long importing the bridge takes.
+
+    python -m benchmarks.startup --runs 5 --max-ms 600
+
+Each run imports slackbridge.main in a fresh interpreter with -X importtime
+and the median is reported, along with the modules that took the longest.
+Modules that are only needed off the hot path (error reports, emoji) are
+checked to make sure nothing has started importing them at startup again.
+
+The exit status is non-zero if the median goes over --max-ms or a deferred
+module was imported, so this can be used to catch regressions. `make test`
+runs this with the default budget.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Modules that should only be imported the first time they are needed
+DEFERRED_MODULES = ('emoji', 'ocflib.misc.mail')
+# Default budget for importing the bridge. It takes about 500 ms, so this
+# leaves room for slower CI machines while still catching something heavy
+# being imported at startup again.
+MAX_IMPORT_MS = 1000
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Import a module in a new interpreter and return the cumulative import
+    time of everything it imported, in microseconds"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--module', default='slackbridge.main')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument(
+        '--max-ms',
+        type=float,
+        default=MAX_IMPORT_MS,
+        help='Fail if the median import time is more than this',
+    )
+    args = parser.parse_args()
+
+    runs: dict[str, list[int]] = defaultdict(list)
+    for _ in range(args.runs):
+        for name, micros in import_times(args.module).items():
+            runs[name].append(micros)
+
+    medians = {name: statistics.median(t) for name, t in runs.items()}
+    total_ms = medians[args.module] / 1000
+    deferred = sorted(
+        name for name in medians
+        if any(
+            name == prefix or name.startswith(prefix + '.')
+            for prefix in DEFERRED_MODULES
+        )
+    )
+    top = sorted(medians.items(), key=lambda item: -item[1])[:args.top]
+    print(
+        json.dumps(
+            {
+                'module': args.module,
+                'runs': args.runs,
+                'median_ms': round(total_ms, 1),
+                'slowest_ms': {name: round(t / 1000, 1) for name, t in top},
+                'deferred_modules_imported': deferred,
+            },
+            indent=2,
+        ),
+    )
+
+    failed = False
+    if total_ms > args.max_ms:
+        print(
+            f'Importing {args.module} took {total_ms:.1f} ms, '
+            f'more than {args.max_ms} ms',
+            file=sys.stderr,
+        )
+        failed = True
+    if deferred:
+        print(
+            f'Imported at startup: {", ".join(deferred)}',
+            file=sys.stderr,
+        )
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Compare TLS setups for connecting many bots to IRC at once.
+
+    python -m benchmarks.tls --bots 1000
+
+A fake IRC server is started in another process over TLS with a self-signed
+certificate, then the given number of IRC clients connect to it at once and
+register, first with a new ClientContextFactory for each connection (how the
+bridge used to connect), then with one SharedClientTLS for all of them (after
+one connection to get a session to resume, like the bridge bot connecting
+before the user bots). For each, the time until every client has registered,
+the CPU time used by the clients, and how many sessions were resumed are
+reported. The server's CPU time is reported separately.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from multiprocessing.connection import Connection
+from typing import Any
+
+from OpenSSL import SSL
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import ssl
+from twisted.internet.protocol import ClientFactory
+from twisted.words.protocols import irc
+
+from benchmarks.loadtest.certs import make_self_signed_cert
+from benchmarks.loadtest.fake_irc import FakeIRCServer
+from slackbridge.tls import SharedClientTLS
+
+
+def raise_fd_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(cert_path: str, key_path: str, pipe: Connection) -> None:
+    """Run the fake IRC server, sending its port and then (when asked) the
+    CPU time it has used through the pipe"""
+    raise_fd_limit()
+    context = ssl.DefaultOpenSSLContextFactory(key_path, cert_path)
+    port = reactor.listenSSL(
+        0, FakeIRCServer(), context, interface='127.0.0.1', backlog=4096,
+    ).getHost().port
+    pipe.send(port)
+
+    def check_pipe() -> None:
+        if pipe.poll():
+            pipe.recv()
+            pipe.send(time.process_time())
+        reactor.callLater(0.1, check_pipe)
+
+    check_pipe()
+    reactor.run()
+
+
+def server_cpu(pipe: Connection) -> float:
+    pipe.send('cpu')
+    return float(pipe.recv())
+
+
+class Bot(irc.IRCClient):
+
+    def signedOn(self) -> None:
+        handle = self.transport.getHandle()
+        if isinstance(handle, SSL.Connection):
+            self.factory.resumed += SSL._lib.SSL_session_reused(handle._ssl)
+        self.factory.done.callback(None)
+
+
+class BotFactory(ClientFactory):
+    protocol = Bot
+
+    def __init__(self, nick: str):
+        self.nickname = nick
+        self.done: defer.Deferred[None] = defer.Deferred()
+        self.resumed = 0
+
+    def buildProtocol(self, addr: Any) -> Bot:
+        bot = Bot()
+        bot.nickname = self.nickname
+        bot.factory = self
+        return bot
+
+    def clientConnectionFailed(self, connector: Any, reason: Any) -> None:
+        self.done.errback(reason)
+
+
+def connect(nick: str, port: int, tls: Any) -> BotFactory:
+    factory = BotFactory(nick)
+    reactor.connectSSL('localhost', port, factory, tls)
+    return factory
+
+
+@defer.inlineCallbacks
+def run_mode(
+    mode: str,
+    bots: int,
+    port: int,
+    cert_path: str,
+    pipe: Connection,
+) -> Any:
+    if mode == 'shared':
+        shared = SharedClientTLS.from_ca_file('localhost', cert_path)
+        # Connect once first to have a session to resume
+        yield connect(f'{mode}-first', port, shared).done
+
+    def tls() -> Any:
+        return ssl.ClientContextFactory() if mode == 'new' else shared
+
+    server_start = server_cpu(pipe)
+    wall_start = time.monotonic()
+    cpu_start = time.process_time()
+    factories = [connect(f'{mode}-{i}', port, tls()) for i in range(bots)]
+    yield defer.gatherResults([factory.done for factory in factories])
+
+    return {
+        'seconds': round(time.monotonic() - wall_start, 3),
+        'client_cpu_seconds': round(time.process_time() - cpu_start, 3),
+        'server_cpu_seconds': round(server_cpu(pipe) - server_start, 3),
+        'sessions_resumed': sum(factory.resumed for factory in factories),
+    }
+
+
+@defer.inlineCallbacks
+def run(args: argparse.Namespace, tmpdir: str, results: dict[str, Any]) -> Any:
+    cert_path, key_path = make_self_signed_cert(tmpdir)
+    # Spawn, not fork, so the server gets its own reactor
+    context = multiprocessing.get_context('spawn')
+    pipe, child_pipe = context.Pipe()
+    server = context.Process(
+        target=serve,
+        args=(cert_path, key_path, child_pipe),
+        daemon=True,
+    )
+    server.start()
+    port = pipe.recv()
+
+    try:
+        for mode in ('new', 'shared'):
+            results[mode] = yield run_mode(
+                mode, args.bots, port, cert_path, pipe,
+            )
+    finally:
+        server.terminate()
+        reactor.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--bots', type=int, default=1000)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    results: dict[str, Any] = {'bots': args.bots}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reactor.callWhenRunning(run, args, tmpdir, results)
+        reactor.run()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
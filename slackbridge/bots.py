@@ -4,40 +4,44 @@ import time
 from queue import PriorityQueue
 from typing import Any
 from typing import Callable
+from typing import TYPE_CHECKING
 from typing import TypeVar
 
-from ocflib.misc.mail import send_problem_report
-from slackclient import SlackClient
 from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
+from twisted.logger import LogLevel
 from twisted.python import log
 from twisted.python.failure import Failure
 from twisted.words.protocols import irc
 
+import slackbridge.logs as logs
+import slackbridge.metrics as metrics
 import slackbridge.utils as utils
+from slackbridge.dedupe import event_key
+from slackbridge.dedupe import posted_key
+from slackbridge.history import MessageIndex
 from slackbridge.messages import IRCUser
 from slackbridge.messages import SlackMessage
+from slackbridge.presence import PresenceManager
+
+if TYPE_CHECKING:
+    from slackbridge.bridge import Bridge
 
 T = TypeVar('T')
 
+# slackclient only reads a single websocket frame per rtm_read() call, so keep
+# reading until there is nothing left, up to this many frames per loop so that
+# a flood of events can't starve the rest of the reactor
+RTM_READS_PER_LOOP = 500
+
 
 class IRCBot(irc.IRCClient):
-    # Global-ish lookup tables for users/channels by id to make it so this
-    # information is not passed around everywhere and to not have to make a
-    # Slack API call each time this information is wanted, since it doesn't
-    # change often and can be updated by events.
-    channels: dict[str, Any] = {}
-    channel_name_to_uid: dict[str, str] = {}
-    users: dict[str, Any] = {}
-    bots: dict[str, Any] = {}
-    # Used to download slack files
-    slack_token: str | None = None
-    sc: SlackClient = None
-    # Used to store lookup and deferred private messages
-    irc_users: dict[str, Any] = {}
-
-    def __init__(self, sc: SlackClient, nickname: str, nickserv_pw: str):
-        self.sc = sc
+
+    def __init__(self, bridge: Bridge, nickname: str, nickserv_pw: str):
+        # Lookup tables for the Slack workspace this bot is bridging, shared
+        # with the rest of its bridge's bots
+        self.bridge = bridge
+        self.sc = bridge.sc
         self.nickname = nickname
         self.nickserv_password = nickserv_pw
 
@@ -54,17 +58,22 @@ class IRCBot(irc.IRCClient):
             nick = user
 
         # Don't post to Slack if it came from a Slack bot
-        if '-slack' not in nick and nick != 'defaultnick':
-            log.msg(
-                self.sc.api_call(
-                    'chat.postMessage',
-                    channel=channel,
-                    text=utils.format_slack_message(message, IRCBot.users),
-                    as_user=False,
-                    username=nick,
-                    icon_url=utils.user_to_gravatar(nick),
+        if '-slack' in nick or nick == 'defaultnick':
+            return
+
+        if self.bridge.slack_poster is not None:
+            self.bridge.slack_poster.post(nick, channel, message)
+        else:
+            response = self.sc.api_call(
+                'chat.postMessage',
+                **utils.format_slack_post(
+                    nick,
+                    channel,
+                    message,
+                    self.bridge.slack_names,
                 ),
             )
+            self.bridge.posted_to_slack(channel, response)
 
 
 class LoopHandler():
@@ -93,6 +102,9 @@ class LoopHandler():
     @staticmethod
     def handle_loop_error(err: Failure, loop_handler: LoopHandler) -> None:
         """Handle errors in a looping function and restart the loop."""
+        # ocflib's mail module pulls in a lot, and is only needed when things
+        # go wrong, so don't import it until then
+        from ocflib.misc.mail import send_problem_report
         send_problem_report(err)
         err.printTraceback()
         # Sleep to avoid tight infinite loops spamming emails
@@ -105,15 +117,20 @@ class BridgeBot(IRCBot):
 
     def __init__(
         self,
-        sc: SlackClient,
+        bridge: Bridge,
         bridge_nick: str,
         nickserv_pw: str,
-        slack_uid: str,
+        presence: PresenceManager,
+        relayed: MessageIndex,
     ):
-        self.slack_uid = slack_uid
+        self.slack_uid = bridge.slack_uid
+        self.presence = presence
+        self.relayed = relayed
         self.message_queue: PriorityQueue[SlackMessage] = PriorityQueue()
+        # Set when shutting down, to stop taking in anything new from Slack
+        self.draining = False
 
-        super().__init__(sc, bridge_nick, nickserv_pw)
+        super().__init__(bridge, bridge_nick, nickserv_pw)
 
         self.rtm_connect()
         rtm_handler = LoopHandler(method=self.check_slack_rtm, delay=1)
@@ -126,6 +143,8 @@ class BridgeBot(IRCBot):
         while not self.sc.rtm_connect(
             with_team_state=False,
             auto_reconnect=True,
+            # Get one presence_change event for many users at once
+            batch_presence_aware=True,
         ):
             log.err('Could not connect to Slack RTM, check token/rate limits')
             time.sleep(5)
@@ -134,20 +153,37 @@ class BridgeBot(IRCBot):
     def signedOn(self) -> None:
         self.msg('NickServ', f'identify {self.nickserv_password}')
         log.msg('Authenticated with NickServ')
+        self.factory.start_user_bots()
 
-        for channel in self.channels.values():
-            log.msg('Joining #{}'.format(channel['name']))
-            self.join('#{}'.format(channel['name']))
+        for channel in self.bridge.channels.values():
+            log.msg(f'Joining #{channel.name}')
+            self.join(f'#{channel.name}')
 
     def privmsg(self, user: str, channel: str, message: str) -> None:
-        self.post_to_slack(user, channel, message)
+        if not self.read_only(channel):
+            self.post_to_slack(user, channel, message)
 
     def action(self, user: str, channel: str, message: str) -> None:
-        self.post_to_slack(user, channel, f'_{message}_')
+        if not self.read_only(channel):
+            self.post_to_slack(user, channel, f'_{message}_')
+
+    def read_only(self, channel: str) -> bool:
+        return (
+            channel.startswith('#') and
+            self.bridge.channel_policy.read_only(channel[1:])
+        )
 
     def check_slack_rtm(self) -> None:
+        if self.draining:
+            return
+
+        message_list: list[dict[str, Any]] = []
         try:
-            message_list = self.sc.rtm_read()
+            for _ in range(RTM_READS_PER_LOOP):
+                messages = self.sc.rtm_read()
+                if not messages:
+                    break
+                message_list.extend(messages)
         except TimeoutError:
             log.err('Retrieving message from Slack RTM timed out')
             self.rtm_connect()
@@ -157,10 +193,31 @@ class BridgeBot(IRCBot):
             return
 
         for message in message_list:
-            log.msg(message)
-
-            if 'type' in message:
-                self.message_queue.put(SlackMessage(message, self))
+            logs.log_rtm_event(message)
+            if self.bridge.rtm_recorder is not None:
+                self.bridge.rtm_recorder.record(message)
+
+            if 'type' not in message:
+                continue
+
+            # Drop echoes of what the bridge posted and anything that was
+            # already queued (RTM can redeliver events after reconnecting)
+            # before doing any other work on them. Only messages have both a
+            # channel id and ts, everything else is let through as it is.
+            key = event_key(message)
+            if key is not None:
+                echo = posted_key(message['channel'], message['ts'])
+                if echo in self.bridge.recent_events:
+                    dropped = 'rtm_echoes_dropped'
+                elif self.bridge.recent_events.seen(key):
+                    dropped = 'rtm_duplicates_dropped'
+                else:
+                    dropped = ''
+                if dropped:
+                    metrics.counters[self.bridge.metric(dropped)] += 1
+                    continue
+
+            self.message_queue.put(SlackMessage(message, self))
 
     def empty_queue(self) -> None:
         while not self.message_queue.empty():
@@ -171,18 +228,22 @@ class BridgeBot(IRCBot):
     # which gets called when the topic changes, or when
     # a channel is entered for the first time.
     def topicUpdated(self, user: str, channel: str, new_topic: str) -> None:
-        channel_uid = self.channel_name_to_uid[channel[1:]]
-        last_topic = self.channels[channel_uid]['topic']['value']
+        bridge = self.bridge
+        channel_uid = bridge.channel_name_to_uid[channel[1:]]
+        last_topic = bridge.channels[channel_uid].topic
 
         # Make sure to strip formatting from the previous topic, otherwise the
         # topic will update on every restart, even when it doesn't need to
-        cleaned_last_topic = utils.format_irc_message(
-            last_topic,
-            IRCBot.users,
-            IRCBot.bots,
-            IRCBot.channels,
-        )
-        if new_topic != cleaned_last_topic:
+        cleaned_last_topic = bridge.formatted_topics.get(last_topic)
+        if cleaned_last_topic is None:
+            cleaned_last_topic = utils.format_irc_message(
+                last_topic,
+                bridge.users,
+                bridge.bots,
+                bridge.known_channels,
+            )
+            bridge.formatted_topics.put(last_topic, cleaned_last_topic)
+        if new_topic != cleaned_last_topic and not self.read_only(channel):
             self.sc.api_call(
                 'conversations.setTopic',
                 channel=channel_uid,
@@ -235,14 +296,14 @@ class BridgeBot(IRCBot):
         self.deauthenticate(user)
 
     def deauthenticate(self, user: str) -> None:
-        if user in self.irc_users:
-            self.irc_users.pop(user)
+        if user in self.bridge.irc_users:
+            self.bridge.irc_users.pop(user)
 
     def authenticate(self, user: str) -> None:
-        if user not in self.irc_users:
-            self.irc_users[user] = IRCUser()
+        if user not in self.bridge.irc_users:
+            self.bridge.irc_users[user] = IRCUser()
         else:
-            self.irc_users[user].authenticated = False
+            self.bridge.irc_users[user].authenticated = False
         self.whois(user)
 
     def verify_auth(
@@ -250,22 +311,22 @@ class BridgeBot(IRCBot):
         current_nickname: str,
         authenticated_name: str,
     ) -> None:
-        user = self.irc_users[current_nickname]
+        user = self.bridge.irc_users[current_nickname]
 
         user.authenticated = (current_nickname == authenticated_name)
 
     def end_whois(self, user: str) -> None:
-        message_copy = self.irc_users[user].messages
+        message_copy = self.bridge.irc_users[user].messages
         for message in message_copy:
             message.resolve()
-            self.irc_users[user].messages.remove(message)
+            self.bridge.irc_users[user].messages.remove(message)
 
 
 class UserBot(IRCBot):
 
     def __init__(
         self,
-        sc: SlackClient,
+        bridge: Bridge,
         nickname: str,
         realname: str,
         user_id: str,
@@ -275,16 +336,16 @@ class UserBot(IRCBot):
     ):
         intended_nickname = f'{utils.strip_nick(nickname)}-slack'
 
-        self.sc = sc
         self.slack_name = nickname
         self.intended_nickname = intended_nickname
         self.realname = realname
         self.user_id = user_id
         self.joined_channels = joined_channels
         self.target_group_nick = target_group
-        self.im_id = None
+        # Last presence sent to IRC, user bots start out away
+        self.presence = 'away'
 
-        super().__init__(sc, intended_nickname, nickserv_pw)
+        super().__init__(bridge, intended_nickname, nickserv_pw)
 
     def log(self, method: Callable[[str], T], message: str) -> T:
         full_message = f'[{self.nickname}]: {message}'
@@ -298,6 +359,7 @@ class UserBot(IRCBot):
             self.join(channel_name)
 
         self.away('Default away for startup.')
+        self.presence = 'away'
 
     def nickserv_auth(self) -> None:
         if self.nickname == self.intended_nickname:
@@ -326,16 +388,20 @@ class UserBot(IRCBot):
         message = "hello"
         """
         if channel == self.nickname:
-            if self.im_id is None:
+            im_id = self.bridge.im_channels.get(self.user_id)
+            if im_id is None:
+                # Only users who have never had an IM with the bridge get
+                # here, everyone else's IM was fetched at startup
+                metrics.counters[self.bridge.metric('im_channels_opened')] += 1
                 im_channel = self.sc.api_call(
                     'conversations.open',
                     users=self.user_id,
                     return_im=True,
                 )
-                self.im_id = im_channel['channel']['id']
-            assert self.im_id is not None
+                im_id = im_channel['channel']['id']
+                self.bridge.im_channels[self.user_id] = im_id
             nick = utils.nick_from_irc_user(user)
-            self.post_to_slack(user, self.im_id, nick + ': ' + message)
+            self.post_to_slack(user, im_id, nick + ': ' + message)
 
     def setNick(self, nickname: str) -> None:
         """
@@ -371,13 +437,19 @@ class UserBot(IRCBot):
         self,
         method: Callable[[str, str], Any],
         channel: str, message: str,
-    ) -> None:
-        log.msg('User bot posting message to IRC')
-        method(
-            channel, utils.format_irc_message(
-                message,
-                IRCBot.users,
-                IRCBot.bots,
-                IRCBot.channels,
-            ),
+    ) -> str:
+        """Format a message for IRC and send it, returning what was sent"""
+        if logs.enabled(logs.irc_log, LogLevel.debug):
+            logs.irc_log.debug(
+                'User bot {nick} posting message to {channel}',
+                nick=self.nickname,
+                channel=channel,
+            )
+        formatted = utils.format_irc_message(
+            message,
+            self.bridge.users,
+            self.bridge.bots,
+            self.bridge.known_channels,
         )
+        method(channel, formatted)
+        return formatted
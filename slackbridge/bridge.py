@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from collections import ChainMap
+from typing import Any
+from typing import TYPE_CHECKING
+
+from twisted.logger import LogLevel
+
+import slackbridge.logs as logs
+import slackbridge.metrics as metrics
+from slackbridge.cache import LRUCache
+from slackbridge.dedupe import DedupeFilter
+from slackbridge.dedupe import posted_key
+from slackbridge.policy import ChannelPolicy
+
+if TYPE_CHECKING:
+    from slackclient import SlackClient
+
+    from slackbridge.capture import RTMRecorder
+    from slackbridge.outbound import SlackPoster
+    from slackbridge.records import SlackChannel
+
+
+class Bridge:
+    """Everything one bridge between a Slack workspace and an IRC network
+    knows, shared by its bridge bot and all of its user bots.
+
+    These are lookup tables for users/channels by id so that this information
+    isn't passed around everywhere, and so that there's no need to make a
+    Slack API call each time it's wanted, since it doesn't change often and
+    can be updated by events. Several bridges can run in one process, each
+    with its own Bridge, while the reactor, the Slack post threads, TLS
+    settings, and metrics are shared between them.
+
+    name tells bridges apart in metrics, and is empty when there's only one.
+    """
+
+    def __init__(
+        self,
+        sc: SlackClient,
+        slack_token: str,
+        slack_uid: str,
+        name: str = '',
+    ):
+        self.name = name
+        self.sc = sc
+        # Used to download slack files
+        self.slack_token = slack_token
+        self.slack_uid = slack_uid
+
+        self.channels: dict[str, SlackChannel] = {}
+        self.channel_name_to_uid: dict[str, str] = {}
+        # How each channel is bridged, and the channels that aren't at all
+        # (these are kept separately, without members, in case the policy
+        # changes)
+        self.channel_policy = ChannelPolicy()
+        self.ignored_channels: dict[str, SlackChannel] = {}
+        self.users: dict[str, Any] = {}
+        # Slack user id -> id of the IM channel between them and the bridge,
+        # which PMs from IRC are posted to. Kept here rather than on each user
+        # bot so that it survives reconnects, and filled in at startup.
+        self.im_channels: dict[str, str] = {}
+        # Slack names of every user with a bot, to turn IRC mentions into
+        # Slack mentions without going through every user bot
+        self.slack_names: set[str] = set()
+        self.bots: dict[str, Any] = {}
+        # Used to store lookup and deferred private messages
+        self.irc_users: dict[str, Any] = {}
+        # Set when running with --capture-rtm to record every RTM frame
+        self.rtm_recorder: RTMRecorder | None = None
+        # RTM events that were recently queued and messages recently posted
+        # by the bridge, to drop duplicate deliveries and echoes before
+        # resolving
+        self.recent_events = DedupeFilter()
+        # Posts messages from IRC to Slack from worker threads if set,
+        # otherwise they are posted directly from the reactor
+        self.slack_poster: SlackPoster | None = None
+
+        # Channel topics from Slack formatted for IRC, keyed by the raw topic.
+        # topicUpdated is called for every channel whenever the bridge
+        # (re)joins, so this saves formatting every topic again each time.
+        self.formatted_topics: LRUCache[str, str] = LRUCache(maxsize=1024)
+        metrics.caches[self.metric('formatted_topics')] = (
+            self.formatted_topics.stats
+        )
+
+    def metric(self, name: str) -> str:
+        """The name to report a metric that's kept for each bridge under"""
+        return f'{self.name}.{name}' if self.name else name
+
+    @property
+    def known_channels(self) -> ChainMap[str, SlackChannel]:
+        """Every channel by id, bridged or not, to name channels that are
+        mentioned in messages"""
+        return ChainMap(self.channels, self.ignored_channels)
+
+    def set_channels(self, channels: list[SlackChannel]) -> None:
+        self.channels = {channel.id: channel for channel in channels}
+        self.channel_name_to_uid = {
+            channel.name: channel.id for channel in channels
+        }
+
+    def posted_to_slack(self, channel: str, response: dict[str, Any]) -> None:
+        if not response.get('ok'):
+            logs.slack_log.warn(
+                'Posting to Slack failed: {error}',
+                error=response.get('error'),
+                channel=channel,
+                response=response,
+            )
+            return
+
+        # Slack sends our own message back over RTM, so remember it to drop
+        # the echo as soon as it arrives. If the echo beats the response here
+        # (possible when posting from a worker thread), it is still dropped as
+        # a bot message.
+        self.recent_events.add(
+            posted_key(response.get('channel', channel), response['ts']),
+        )
+        if logs.enabled(logs.slack_log, LogLevel.debug):
+            logs.slack_log.debug(
+                'Posted message to {channel}',
+                channel=channel,
+                ts=response.get('ts'),
+            )
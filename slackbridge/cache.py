@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any
+from typing import Generic
+from typing import TypeVar
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+
+class LRUCache(Generic[K, V]):
+    """A mapping that holds at most `maxsize` entries, dropping the least
+    recently used one first, and counts hits and misses so that its hit rate
+    can be reported with the rest of the metrics"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[K, V] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.entries
+
+    def get(self, key: K) -> V | None:
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        return self.entries.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        return cache_stats(self.hits, self.misses, len(self), self.maxsize)
+
+
+def cache_stats(
+    hits: int,
+    misses: int,
+    size: int,
+    maxsize: int | None,
+) -> dict[str, Any]:
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else None,
+        'size': size,
+        'maxsize': maxsize,
+    }
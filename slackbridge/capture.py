@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from typing import Any
+from typing import Iterator
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+
+
+class RTMRecorder:
+    """Records raw RTM frames, and when they were read, to a capture file.
+
+    Captures are gzipped newline-delimited JSON. The first line is a header
+    with the users and channels the bridge started with, so that a capture
+    can be replayed (see benchmarks/replay.py) without talking to Slack, and
+    every line after that is {"t": <unix time>, "event": <RTM frame>}.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        users: list[SlackUser],
+        channels: list[SlackChannel],
+    ):
+        self.path = path
+        self.file = gzip.open(path, 'wt', compresslevel=6)
+        self._write({
+            'header': {
+                'started': time.time(),
+                'users': [
+                    {'id': u.id, 'name': u.name, 'real_name': u.real_name}
+                    for u in users
+                ],
+                'channels': [
+                    {
+                        'id': c.id,
+                        'name': c.name,
+                        'topic': {'value': c.topic},
+                        'members': sorted(c.members),
+                    }
+                    for c in channels
+                ],
+            },
+        })
+
+        # Flush every so often so that a crash doesn't lose the whole capture
+        self.flusher = LoopingCall(self.file.flush)
+        self.flusher.start(5, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.close)
+        log.msg(f'Capturing RTM events to {path}')
+
+    def _write(self, obj: dict[str, Any]) -> None:
+        self.file.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+    def record(self, event: dict[str, Any]) -> None:
+        self._write({'t': round(time.time(), 3), 'event': event})
+
+    def close(self) -> None:
+        # The reactor can keep running for a while after this (to finish
+        # shutting down gracefully), so stop flushing first
+        if self.flusher.running:
+            self.flusher.stop()
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_capture(
+    path: str,
+) -> tuple[dict[str, Any], Iterator[tuple[float, dict[str, Any]]]]:
+    """Return the header of a capture file and an iterator over its events,
+    as (seconds since the capture started, RTM frame) pairs"""
+    f = gzip.open(path, 'rt')
+    header = json.loads(f.readline())['header']
+
+    def events() -> Iterator[tuple[float, dict[str, Any]]]:
+        with f:
+            for line in f:
+                entry = json.loads(line)
+                yield entry['t'] - header['started'], entry['event']
+
+    return header, events()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+from typing import Hashable
+
+# How long to remember events for. RTM redeliveries after a reconnect and
+# echoes of our own posts show up within seconds, so this is plenty.
+DEDUPE_WINDOW = 120
+
+# Most keys kept per generation, so that memory stays bounded even if Slack
+# floods us with events
+DEDUPE_MAXSIZE = 50000
+
+
+class DedupeFilter:
+    """A time-windowed set of recently seen keys, with a fixed memory limit.
+
+    Keys are stored as their hashes in two generations. Every `window`
+    seconds (or once the current generation holds `maxsize` hashes) the
+    older generation is dropped and the current one becomes the older one,
+    so keys are remembered for between one and two windows. A hash collision
+    could make two different keys look the same, but with 64-bit hashes and
+    at most 2 * maxsize entries that isn't worth worrying about.
+    """
+
+    def __init__(
+        self,
+        window: float = DEDUPE_WINDOW,
+        maxsize: int = DEDUPE_MAXSIZE,
+    ):
+        self.window = window
+        self.maxsize = maxsize
+        self.current: set[int] = set()
+        self.previous: set[int] = set()
+        self.rotated_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.current) + len(self.previous)
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self.rotated_at >= 2 * self.window:
+            self.previous = set()
+            self.current = set()
+            self.rotated_at = now
+        elif (
+            now - self.rotated_at >= self.window or
+            len(self.current) >= self.maxsize
+        ):
+            self.previous = self.current
+            self.current = set()
+            self.rotated_at = now
+
+    def add(self, key: Hashable) -> None:
+        self._rotate()
+        self.current.add(hash(key))
+
+    def seen(self, key: Hashable) -> bool:
+        """Add the key, returning whether it was already there"""
+        self._rotate()
+        h = hash(key)
+        if h in self.current or h in self.previous:
+            return True
+        self.current.add(h)
+        return False
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._rotate()
+        h = hash(key)
+        return h in self.current or h in self.previous
+
+
+def event_key(event: dict[str, Any]) -> Hashable | None:
+    """Identify an RTM event so that redeliveries of it can be recognized.
+
+    Messages are unique by channel and ts, and the text is included as well
+    so that two different events that happen to share a ts can't be taken
+    for one another. Only events with a channel id and ts are deduplicated.
+    Others either legitimately repeat (presence changes, for instance) or
+    have a whole channel object in "channel" (channel_created, im_created,
+    etc.), and are left alone.
+    """
+    channel = event.get('channel')
+    ts = event.get('ts')
+    if not isinstance(channel, str) or not isinstance(ts, str):
+        return None
+    text = event.get('text')
+    return (
+        'event',
+        event.get('type'),
+        event.get('subtype'),
+        channel,
+        ts,
+        text if isinstance(text, str) else None,
+    )
+
+
+def posted_key(channel: str, ts: str) -> Hashable:
+    """Identify a message the bridge posted itself, which Slack then sends
+    back over RTM with the same channel and ts"""
+    return ('posted', channel, ts)
@@ -1,21 +1,28 @@
 from __future__ import annotations
 
 from typing import Any
+from typing import Callable
+from typing import TYPE_CHECKING
 
-from slackclient import SlackClient
 from twisted.internet import reactor
-from twisted.internet import ssl
 from twisted.internet.interfaces import IAddress
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.python import log
 from twisted.python.failure import Failure
 
 from slackbridge.bots import BridgeBot
-from slackbridge.bots import IRCBot
 from slackbridge.bots import UserBot
-from slackbridge.utils import IRC_HOST
+from slackbridge.history import MessageIndex
+from slackbridge.policy import ChannelPolicy
+from slackbridge.presence import PresenceManager
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+from slackbridge.tls import SharedClientTLS
 from slackbridge.utils import IRC_PORT
 
+if TYPE_CHECKING:
+    from slackbridge.bridge import Bridge
+
 
 class BotFactory(ReconnectingClientFactory):
 
@@ -32,87 +39,188 @@ class BridgeBotFactory(BotFactory):
 
     def __init__(
         self,
-        slack_client: SlackClient,
+        bridge: Bridge,
         bridge_nick: str,
         nickserv_pw: str,
-        slack_uid: str,
-        channels: list[dict[str, Any]],
-        users: list[dict[str, Any]],
+        channels: list[SlackChannel],
+        users: list[SlackUser],
+        presence: PresenceManager,
+        relayed: MessageIndex,
+        irc_host: str,
+        irc_port: int = IRC_PORT,
+        tls: SharedClientTLS | None = None,
     ):
-        self.slack_client = slack_client
-        self.slack_uid = slack_uid
+        self.bridge = bridge
+        self.slack_uid = bridge.slack_uid
         self.bridge_nickname = bridge_nick
         self.nickserv_password = nickserv_pw
+        self.presence = presence
+        self.relayed = relayed
+        self.irc_host = irc_host
+        self.irc_port = irc_port
+        # Every bot connects with the same TLS settings, so that they can
+        # resume each other's sessions instead of doing full handshakes
+        self.tls = tls or SharedClientTLS(irc_host)
         self.bot_class = BridgeBot
+        self.user_factories: dict[str, UserBotFactory] = {}
 
-        # Give all bots access to the Slack channel and user list
-        IRCBot.channels = {
-            channel['id']: channel for channel in channels
-        }
-        IRCBot.channel_name_to_uid = {
-            channel['name']: channel['id'] for channel in channels
-        }
+        # Give all bots access to the Slack channel list
+        bridge.set_channels(channels)
 
-        # Create individual user bots with their own connections to the IRC
-        # server and their own nicknames
-        for user in users:
-            self.instantiate_bot(user)
+        # User bots are started once the bridge bot has connected, so that
+        # they can all resume its TLS session
+        self.pending_users = users
 
     def buildProtocol(self, addr: IAddress) -> BridgeBot:
         p = BridgeBot(
-            self.slack_client,
+            self.bridge,
             self.bridge_nickname,
             self.nickserv_password,
-            self.slack_uid,
+            self.presence,
+            self.relayed,
         )
-        IRCBot.bots[self.slack_uid] = p
+        self.bridge.bots[self.slack_uid] = p
         p.factory = self
         self.resetDelay()
         return p
 
+    def start_user_bots(self) -> None:
+        """Create individual user bots with their own connections to the IRC
+        server and their own nicknames. Only does anything the first time
+        it's called, reconnecting is left to each bot's factory."""
+        users, self.pending_users = self.pending_users, []
+        for user in users:
+            self.instantiate_bot(user)
+
     def add_user_bot(self, user_bot: UserBot) -> None:
-        IRCBot.users[user_bot.user_id] = user_bot
+        self.bridge.users[user_bot.user_id] = user_bot
+        self.bridge.slack_names.add(user_bot.slack_name)
 
-    def instantiate_bot(self, user: dict[str, Any]) -> None:
+    def instantiate_bot(self, user: SlackUser) -> None:
         user_factory = UserBotFactory(
-            self.slack_client,
+            self.bridge,
             self,
             user,
             self.bridge_nickname,
             self.nickserv_password,
         )
+        self.user_factories[user.id] = user_factory
         reactor.connectSSL(
-            IRC_HOST, IRC_PORT, user_factory, ssl.ClientContextFactory(),
+            self.irc_host,
+            self.irc_port,
+            user_factory,
+            self.tls,
         )
 
+    def set_nickserv_password(self, nickserv_pw: str) -> None:
+        """Use a new NickServ password from now on. Bots that are connected
+        have already identified, so they only use it if they reconnect."""
+        self.nickserv_password = nickserv_pw
+        for user_factory in self.user_factories.values():
+            user_factory.nickserv_password = nickserv_pw
+        for bot in [*self.bridge.bots.values(), *self.bridge.users.values()]:
+            bot.nickserv_password = nickserv_pw
+
+    def set_channel_policy(
+        self,
+        policy: ChannelPolicy,
+        fetch_members: Callable[[SlackChannel], None],
+    ) -> None:
+        """Switch to a new channel policy, leaving channels that are now
+        ignored and joining ones that no longer are. Only the bots that are
+        members of those channels do anything.
+
+        The members of channels to join are fetched before anything else
+        changes, so if that fails, the bridge is left as it was and the whole
+        policy can be applied again later."""
+        joining = [
+            channel for channel in self.bridge.ignored_channels.values()
+            if not policy.ignored(channel.name)
+        ]
+        for channel in joining:
+            # Querying Slack for members of an empty channel causes an error
+            if channel.num_members:
+                fetch_members(channel)
+
+        self.bridge.channel_policy = policy
+        for channel in list(self.bridge.channels.values()):
+            if policy.ignored(channel.name):
+                self.stop_bridging(channel)
+        for channel in joining:
+            self.start_bridging(channel)
+
+    def stop_bridging(self, channel: SlackChannel) -> None:
+        log.msg(f'No longer bridging #{channel.name}')
+        del self.bridge.channels[channel.id]
+        self.bridge.channel_name_to_uid.pop(channel.name, None)
+        self.bridge.ignored_channels[channel.id] = channel
+
+        bridge_bot = self.bridge.bots.get(self.slack_uid)
+        if bridge_bot is not None:
+            bridge_bot.leave(channel.name)
+        for user_id in channel.members:
+            user_factory = self.user_factories.get(user_id)
+            if user_factory is None:
+                continue
+            # Joined channels are stored both with and without the #
+            for name in (channel.name, '#' + channel.name):
+                if name in user_factory.joined_channels:
+                    user_factory.joined_channels.remove(name)
+            user_bot = self.bridge.users.get(user_id)
+            if user_bot is not None:
+                user_bot.leave(channel.name)
+        # Members are fetched again if the channel is bridged again
+        channel.members.clear()
+
+    def start_bridging(self, channel: SlackChannel) -> None:
+        log.msg(f'Now bridging #{channel.name}')
+        del self.bridge.ignored_channels[channel.id]
+        self.bridge.channels[channel.id] = channel
+        self.bridge.channel_name_to_uid[channel.name] = channel.id
+
+        bridge_bot = self.bridge.bots.get(self.slack_uid)
+        if bridge_bot is not None:
+            bridge_bot.join(channel.name)
+        for user_id in channel.members:
+            user_factory = self.user_factories.get(user_id)
+            if user_factory is None:
+                continue
+            user_factory.joined_channels.append(channel.name)
+            user_bot = self.bridge.users.get(user_id)
+            if user_bot is not None:
+                user_bot.join(channel.name)
+
 
 class UserBotFactory(BotFactory):
 
     def __init__(
         self,
-        slack_client: SlackClient,
+        bridge: Bridge,
         bridge_bot_factory: BridgeBotFactory,
-        slack_user: dict[str, Any],
+        slack_user: SlackUser,
         target_group: str,
         nickserv_pw: str,
     ):
-        self.slack_client = slack_client
+        self.bridge = bridge
         self.bridge_bot_factory = bridge_bot_factory
         self.slack_user = slack_user
         self.joined_channels: list[str] = []
         self.target_group_nick = target_group
         self.nickserv_password = nickserv_pw
 
-        for channel in IRCBot.channels.values():
-            if slack_user['id'] in channel['members']:
-                self.joined_channels.append(channel['name'])
+        for channel in bridge.channels.values():
+            if (
+                slack_user.id in channel.members and
+                not bridge.channel_policy.ignored(channel.name)
+            ):
+                self.joined_channels.append(channel.name)
 
     def buildProtocol(self, addr: IAddress) -> UserBot:
         p = UserBot(
-            self.slack_client,
-            self.slack_user['name'],
-            self.slack_user['real_name'],
-            self.slack_user['id'],
+            self.bridge,
+            self.slack_user.name,
+            self.slack_user.real_name,
+            self.slack_user.id,
             self.joined_channels,
             self.target_group_nick,
             self.nickserv_password,
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+
+import twisted
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+
+TWISTED_DIR = os.path.dirname(twisted.__file__)
+
+
+class Stall:
+    """A period of time where the reactor did not get to run its callbacks"""
+
+    def __init__(self, started: float, callback: str, stack: list[str]):
+        self.started = started
+        self.duration = 0.0
+        self.callback = callback
+        self.stack = stack
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'started': self.started,
+            'duration': round(self.duration, 3),
+            'callback': self.callback,
+            'stack': self.stack,
+        }
+
+
+class ReactorWatchdog:
+    """Measure event loop lag and catch whatever is blocking the reactor.
+
+    A LoopingCall on the reactor records a heartbeat every `interval` seconds,
+    and the difference between when it was scheduled to run and when it
+    actually ran is the reactor lag. Because a blocked reactor can't notice
+    that it is blocked, a separate monitor thread watches the heartbeat and
+    samples the reactor thread's stack once it has been stuck for longer than
+    `stall_threshold` seconds, so that we know which callback was at fault
+    (e.g. a synchronous Slack API call).
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        stall_threshold: float = 2.0,
+        unhealthy_after: float = 30.0,
+    ):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.unhealthy_after = unhealthy_after
+
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls: deque[Stall] = deque(maxlen=20)
+        self.current_stall: Stall | None = None
+        # The monitor thread adds stalls while /healthz reads them from
+        # another thread, and a deque can't be iterated while it changes
+        self._stalls_lock = threading.Lock()
+
+        self._last_tick = time.monotonic()
+        self._reactor_thread: int | None = None
+
+    def start(self) -> None:
+        reactor.callWhenRunning(self._start_on_reactor)
+
+    def _start_on_reactor(self) -> None:
+        self._reactor_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        LoopingCall(self._tick).start(self.interval)
+        threading.Thread(
+            target=self._monitor,
+            name='reactor-watchdog',
+            daemon=True,
+        ).start()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        self.lag = max(0.0, now - self._last_tick - self.interval)
+        self.max_lag = max(self.max_lag, self.lag)
+        self._last_tick = now
+
+        stall = self.current_stall
+        if stall is not None:
+            stall.duration = self.lag
+            self.current_stall = None
+            log.err(
+                'Reactor was blocked for {:.2f}s in {}'.format(
+                    stall.duration,
+                    stall.callback,
+                ),
+            )
+
+    def _monitor(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if (
+                self.current_stall is None and
+                self.blocked_for() > self.stall_threshold
+            ):
+                self.current_stall = self._sample_stall()
+                with self._stalls_lock:
+                    self.stalls.append(self.current_stall)
+
+    def _sample_stall(self) -> Stall:
+        """Grab the stack of the reactor thread while it is blocked"""
+        assert self._reactor_thread is not None
+        frame = sys._current_frames().get(self._reactor_thread)
+        stack = traceback.extract_stack(frame) if frame else []
+
+        # The callback at fault is the first bit of non-Twisted code called
+        # from inside the reactor's run loop
+        callback = 'unknown'
+        in_reactor = False
+        for entry in stack:
+            if entry.filename.startswith(TWISTED_DIR):
+                in_reactor = True
+            elif in_reactor:
+                callback = f'{entry.name} ({entry.filename}:{entry.lineno})'
+                break
+
+        return Stall(
+            started=time.time() - self.blocked_for(),
+            callback=callback,
+            stack=traceback.format_list(stack),
+        )
+
+    def blocked_for(self) -> float:
+        """Seconds since the reactor last managed to run the heartbeat"""
+        if self._reactor_thread is None:
+            # Still starting up, the reactor isn't running yet
+            return 0.0
+        return max(0.0, time.monotonic() - self._last_tick - self.interval)
+
+    def healthy(self) -> bool:
+        return self.blocked_for() < self.unhealthy_after
+
+    def status(self) -> dict[str, Any]:
+        with self._stalls_lock:
+            stalls = list(self.stalls)
+        return {
+            'healthy': self.healthy(),
+            'blocked_for': round(self.blocked_for(), 3),
+            'lag': round(self.lag, 3),
+            'max_lag': round(self.max_lag, 3),
+            'stalls': [stall.to_dict() for stall in stalls],
+        }
+
+
+class HealthServer:
+    """Serves /healthz for Kubernetes liveness probes.
+
+    This runs in its own thread instead of on the reactor so that it can still
+    answer (with a 503 and the stack of the stall) when the reactor is stuck.
+    """
+
+    def __init__(self, watchdog: ReactorWatchdog, port: int):
+        self.watchdog = watchdog
+        self.port = port
+
+    def start(self) -> None:
+        watchdog = self.watchdog
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != '/healthz':
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(watchdog.status()).encode()
+                self.send_response(200 if watchdog.healthy() else 503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # Probes come in every few seconds, don't fill the logs
+                pass
+
+        server = ThreadingHTTPServer(('', self.port), Handler)
+        threading.Thread(
+            target=server.serve_forever,
+            name='health-server',
+            daemon=True,
+        ).start()
+        log.msg(f'Serving /healthz on port {self.port}')
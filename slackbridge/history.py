@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import difflib
+import time
+from collections import OrderedDict
+from typing import Any
+
+from slackbridge.cache import cache_stats
+
+# Edits that change more separate places than this are sent as the whole new
+# message instead of a list of changes
+MAX_CORRECTION_CHANGES = 3
+
+
+class RelayedMessage:
+    """What was sent to IRC for a Slack message"""
+    __slots__ = ('user_id', 'channel_name', 'text', 'sent_at')
+
+    def __init__(self, user_id: str, channel_name: str, text: str):
+        self.user_id = user_id
+        self.channel_name = channel_name
+        # Formatted for IRC, with the lines of the message joined by newlines
+        self.text = text
+        self.sent_at = time.monotonic()
+
+
+class MessageIndex:
+    """Recently relayed messages, keyed by Slack channel and ts, so that edits
+    and deletes in Slack can be matched up with what IRC has already seen.
+
+    Entries are kept in the order they were added, so expiring the oldest
+    ones is just popping from the front. At most `maxsize` messages are kept,
+    and none older than `max_age` seconds, since there's no point in
+    correcting a message that's long gone from everyone's scrollback.
+    Lookups and insertions are O(1) (amortized, for insertions).
+    """
+
+    def __init__(self, maxsize: int = 5000, max_age: float = 3600):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.entries: OrderedDict[tuple[str, str], RelayedMessage] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, channel_id: str, ts: str, message: RelayedMessage) -> None:
+        self.entries[channel_id, ts] = message
+        self.expire()
+
+    def get(self, channel_id: str, ts: str) -> RelayedMessage | None:
+        message = self.entries.get((channel_id, ts))
+        if (
+            message is None or
+            message.sent_at < time.monotonic() - self.max_age
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return message
+
+    def pop(self, channel_id: str, ts: str) -> RelayedMessage | None:
+        return self.entries.pop((channel_id, ts), None)
+
+    def expire(self) -> None:
+        cutoff = time.monotonic() - self.max_age
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if len(self.entries) <= self.maxsize and oldest.sent_at >= cutoff:
+                break
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        return cache_stats(self.hits, self.misses, len(self), self.maxsize)
+
+
+def format_correction(old: str, new: str) -> str | None:
+    """
+    Describe an edit to a message that was already sent to IRC as a single
+    short line, or return None if the edit didn't change any words (Slack
+    also sends message_changed when links are unfurled, for instance).
+
+    Changes are compared word by word, so fixing a typo looks like:
+
+    * fix: teh → the
+
+    and words that were added or removed are shown with a + or -. If the
+    message changed too much for that to be shorter, the whole new message
+    is sent instead.
+    """
+    old_words = old.split()
+    new_words = new.split()
+    if old_words == new_words:
+        return None
+
+    matcher = difflib.SequenceMatcher(None, old_words, new_words, False)
+    changes = []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        removed = ' '.join(old_words[i1:i2])
+        added = ' '.join(new_words[j1:j2])
+        if op == 'replace':
+            changes.append(f'{removed} → {added}')
+        elif op == 'delete':
+            changes.append(f'-{removed}')
+        elif op == 'insert':
+            changes.append(f'+{added}')
+
+    summary = '; '.join(changes)
+    new_text = ' '.join(new_words)
+    if len(changes) > MAX_CORRECTION_CHANGES or len(summary) >= len(new_text):
+        summary = new_text
+    return f'* fix: {summary}'
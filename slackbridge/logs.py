@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import sys
+from collections import Counter
+from configparser import ConfigParser
+from typing import Any
+
+from twisted.logger import FilteringLogObserver
+from twisted.logger import globalLogBeginner
+from twisted.logger import jsonFileLogObserver
+from twisted.logger import Logger
+from twisted.logger import LogLevel
+from twisted.logger import LogLevelFilterPredicate
+from twisted.logger import textFileLogObserver
+
+# Default log levels for RTM event types. Presence changes and typing
+# indicators are most of the RTM traffic we get and are almost never
+# interesting, so they are only logged when debugging.
+RTM_EVENT_LEVELS = {
+    'presence_change': LogLevel.debug,
+    'user_typing': LogLevel.debug,
+    'pong': LogLevel.debug,
+    'reconnect_url': LogLevel.debug,
+}
+
+rtm_log = Logger(namespace='slackbridge.rtm')
+slack_log = Logger(namespace='slackbridge.slack')
+irc_log = Logger(namespace='slackbridge.irc')
+
+# Shared by the observer and by enabled(), so that callers on hot paths can
+# check whether anything would be logged before building a log event at all
+level_predicate = LogLevelFilterPredicate(defaultLogLevel=LogLevel.info)
+
+
+def enabled(logger: Logger, level: LogLevel) -> bool:
+    return level >= level_predicate.logLevelForNamespace(logger.namespace)
+
+
+def parse_pairs(value: str) -> dict[str, str]:
+    """Parse a config value like "presence_change:debug, message:info" """
+    pairs = (pair.split(':', 1) for pair in value.split(',') if ':' in pair)
+    return {key.strip(): value.strip() for key, value in pairs}
+
+
+class RTMEventLogger:
+    """Logs raw RTM events with a level and sample rate per event type.
+
+    The checks are done before anything is handed to the logging system, so
+    suppressed or unsampled events cost a dict lookup and nothing else. Events
+    that do get through are passed along as structured fields and only
+    serialized by the observer.
+    """
+
+    def __init__(
+        self,
+        levels: dict[str, LogLevel] | None = None,
+        sample_rates: dict[str, int] | None = None,
+    ):
+        self.levels = dict(RTM_EVENT_LEVELS)
+        self.levels.update(levels or {})
+        # Log 1 out of every N events of a given type
+        self.sample_rates = dict(sample_rates or {})
+        self.seen: Counter[str] = Counter()
+
+    def __call__(self, event: dict[str, Any]) -> None:
+        event_type = event.get('type', 'unknown')
+        level = self.levels.get(event_type, LogLevel.info)
+        if not enabled(rtm_log, level):
+            return
+
+        rate = self.sample_rates.get(event_type, 1)
+        if rate > 1:
+            self.seen[event_type] += 1
+            if self.seen[event_type] % rate != 1:
+                return
+
+        rtm_log.emit(
+            level,
+            'RTM event {event_type}',
+            event_type=event_type,
+            event=event,
+            sample_rate=rate,
+        )
+
+
+log_rtm_event = RTMEventLogger()
+
+
+def start_logging(conf: ConfigParser) -> None:
+    """Set up logging from the [logging] section of the config. Everything
+    goes to stdout, which will be passed to syslog by stdin2syslog"""
+    apply_levels(conf)
+
+    if conf.get('logging', 'format', fallback='json') == 'json':
+        observer = jsonFileLogObserver(sys.stdout, recordSeparator='')
+    else:
+        observer = textFileLogObserver(sys.stdout)
+
+    globalLogBeginner.beginLoggingTo(
+        [FilteringLogObserver(observer, [level_predicate])],
+        redirectStandardIO=False,
+    )
+
+
+def apply_levels(conf: ConfigParser) -> None:
+    """Set log levels and RTM event sampling from the config, replacing any
+    that were set before so that this can also be used on config reloads"""
+    level_predicate.clearLogLevels()
+    level_predicate.setLogLevelForNamespace(
+        '',
+        LogLevel.levelWithName(conf.get('logging', 'level', fallback='info')),
+    )
+    namespace_levels = parse_pairs(
+        conf.get('logging', 'namespace_levels', fallback=''),
+    )
+    for namespace, level_name in namespace_levels.items():
+        level_predicate.setLogLevelForNamespace(
+            namespace,
+            LogLevel.levelWithName(level_name),
+        )
+
+    rtm_levels = parse_pairs(conf.get('logging', 'rtm_levels', fallback=''))
+    log_rtm_event.levels = dict(RTM_EVENT_LEVELS)
+    for event_type, level_name in rtm_levels.items():
+        log_rtm_event.levels[event_type] = LogLevel.levelWithName(level_name)
+    rtm_sample = parse_pairs(conf.get('logging', 'rtm_sample', fallback=''))
+    log_rtm_event.sample_rates = {
+        event_type: int(rate) for event_type, rate in rtm_sample.items()
+    }
@@ -1,21 +1,44 @@
 from __future__ import annotations
 
 import argparse
+import os
 import sys
+import tracemalloc
 from configparser import ConfigParser
+from typing import Any
+from typing import Callable
 
 from slackclient import SlackClient
 from twisted.internet import reactor
-from twisted.internet import ssl
 from twisted.python import log
+from twisted.python.threadpool import ThreadPool
 
-from slackbridge.bots import IRCBot
+import slackbridge.logs as logs
+import slackbridge.metrics as metrics
+from slackbridge.bridge import Bridge
+from slackbridge.capture import RTMRecorder
 from slackbridge.factories import BridgeBotFactory
-from slackbridge.utils import IRC_HOST
+from slackbridge.health import HealthServer
+from slackbridge.health import ReactorWatchdog
+from slackbridge.history import MessageIndex
+from slackbridge.outbound import SlackPoster
+from slackbridge.outbound import start_pool
+from slackbridge.policy import ChannelPolicy
+from slackbridge.presence import PresenceManager
+from slackbridge.profiling import Profiler
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+from slackbridge.reload import ConfigReloader
+from slackbridge.reload import install_signal_handler
+from slackbridge.shutdown import GracefulShutdown
+from slackbridge.tls import SharedClientTLS
+from slackbridge.utils import checked_slack_api
+from slackbridge.utils import default_irc_host
 from slackbridge.utils import IRC_PORT
 from slackbridge.utils import slack_api
 
 BRIDGE_NICKNAME = 'slack-bridge'
+DEFAULT_CONFIG = '/etc/ocf-slackbridge/slackbridge.conf'
 
 
 def main() -> None:
@@ -26,27 +49,149 @@ def main() -> None:
     parser.add_argument(
         '-c',
         '--config',
-        default='/etc/ocf-slackbridge/slackbridge.conf',
-        help='Config file to read from.',
+        action='append',
+        help='Config file to read from. Give this more than once to run a '
+        'bridge for each config in one process, which then share the rest '
+        f'(health, profiling, etc.) of the first one. (default: '
+        f'{DEFAULT_CONFIG})',
+    )
+    parser.add_argument(
+        '--capture-rtm',
+        metavar='PATH',
+        help='Record every RTM event to a gzipped capture file for replaying '
+        'later with benchmarks/replay.py.',
     )
     args = parser.parse_args()
+    paths = args.config or [DEFAULT_CONFIG]
+    if args.capture_rtm and len(paths) > 1:
+        parser.error('--capture-rtm only works with a single bridge')
+
+    confs = []
+    for path in paths:
+        bridge_conf = ConfigParser()
+        bridge_conf.read(path)
+        confs.append(bridge_conf)
+    # Anything not specific to a bridge is set up from the first config
+    conf = confs[0]
+
+    logs.start_logging(conf)
+
+    # Watch for anything blocking the reactor and report it on /healthz so
+    # that Kubernetes can restart us if we get stuck
+    watchdog = ReactorWatchdog(
+        stall_threshold=conf.getfloat(
+            'health', 'stall_threshold', fallback=2,
+        ),
+        unhealthy_after=conf.getfloat(
+            'health', 'unhealthy_after', fallback=30,
+        ),
+    )
+    watchdog.start()
+    health_port = conf.getint('health', 'port', fallback=8080)
+    HealthServer(watchdog, health_port).start()
+
+    # On-demand profiling controls, see the Profiler docstring for usage
+    if conf.getboolean('profiling', 'tracemalloc', fallback=False):
+        tracemalloc.start()
+    profiler = Profiler(conf.get('profiling', 'dump_dir', fallback='/tmp'))
+    profiler.install_signal_handlers()
+    admin_socket = conf.get('profiling', 'admin_socket', fallback='')
+    if admin_socket:
+        profiler.listen(admin_socket)
+
+    # Every bridge posts messages from IRC to Slack from the same threads,
+    # and bridges to the same IRC server share TLS sessions
+    pool = start_pool(conf.getint('slack', 'post_workers', fallback=4))
+    tls_contexts: dict[tuple[str, str], SharedClientTLS] = {}
+
+    factories = []
+    reloaders = []
+    for path, bridge_conf in zip(paths, confs):
+        # Per-bridge metrics are only told apart by name if there are several
+        name = bridge_name(path) if len(paths) > 1 else ''
+        reloader = ConfigReloader(path, bridge_conf)
+        factory = start_bridge(
+            name,
+            bridge_conf,
+            reloader,
+            pool,
+            tls_contexts,
+            args.capture_rtm,
+        )
+        profiler.bridges.append(factory.bridge)
+        factories.append(factory)
+        reloaders.append(reloader)
+
+    # Send what's queued and QUIT every bot on SIGTERM before exiting
+    shutdown = GracefulShutdown(
+        factories,
+        drain_timeout=conf.getfloat('shutdown', 'drain_timeout', fallback=10),
+        quit_rate=conf.getint('shutdown', 'quit_rate', fallback=100),
+        deadline=conf.getfloat('shutdown', 'deadline', fallback=25),
+    )
+    shutdown.install()
+
+    # Apply config changes on SIGHUP, to only the parts that changed
+    reloader = reloaders[0]
+    reloader.on_change(('logging',), logs.apply_levels)
+    reloader.on_change(
+        ('slack',),
+        lambda conf: pool.adjustPoolsize(
+            minthreads=0,
+            maxthreads=conf.getint('slack', 'post_workers', fallback=4),
+        ),
+    )
+    reloader.on_change(
+        ('health',),
+        lambda conf: set_attrs(
+            watchdog,
+            stall_threshold=conf.getfloat(
+                'health', 'stall_threshold', fallback=2,
+            ),
+            unhealthy_after=conf.getfloat(
+                'health', 'unhealthy_after', fallback=30,
+            ),
+        ),
+    )
+    reloader.on_change(('profiling',), profiler.configure)
+    reloader.on_change(
+        ('shutdown',),
+        lambda conf: set_attrs(
+            shutdown,
+            drain_timeout=conf.getfloat(
+                'shutdown', 'drain_timeout', fallback=10,
+            ),
+            quit_rate=conf.getint('shutdown', 'quit_rate', fallback=100),
+            deadline=conf.getfloat('shutdown', 'deadline', fallback=25),
+        ),
+    )
+    install_signal_handler(reloaders)
+
+    reactor.run()
+
 
-    conf = ConfigParser()
-    conf.read(args.config)
+def bridge_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
 
+
+def start_bridge(
+    name: str,
+    conf: ConfigParser,
+    reloader: ConfigReloader,
+    pool: ThreadPool,
+    tls_contexts: dict[tuple[str, str], SharedClientTLS],
+    capture_rtm: str | None = None,
+) -> BridgeBotFactory:
+    """Get everything a bridge needs from Slack and connect its bridge bot
+    (which connects the user bots) to IRC, returning the bridge bot's
+    factory. Changes to the bridge's config are applied by the reloader."""
     # Slack configuration
     slack_token = conf.get('slack', 'token')
     slack_uid = conf.get('slack', 'user')
 
     # Initialize Slack Client
     sc = SlackClient(slack_token)
-
-    # Set IRCBot class variables to avoid
-    # senselessly passing around variables
-    IRCBot.slack_token = slack_token
-
-    # Log everything to stdout, which will be passed to syslog by stdin2syslog
-    log.startLogging(sys.stdout)
+    bridge = Bridge(sc, slack_token, slack_uid, name)
 
     # Get all channels from Slack
     log.msg('Requesting list of channels from Slack...')
@@ -56,58 +201,194 @@ def main() -> None:
         limit=500,
         exclude_archived=True,
     )
-    slack_channels = results['channels']
+    # Only keep the fields we need from each channel, the full objects from
+    # Slack are much bigger and are kept around for the whole run
+    slack_channels = []
+    bridge.channel_policy = ChannelPolicy.from_config(conf)
+
+    for channel in results['channels']:
+        record = SlackChannel.from_dict(channel)
+
+        # Ignored channels aren't joined, so there's no need for their members
+        if bridge.channel_policy.ignored(record.name):
+            bridge.ignored_channels[record.id] = record
+            continue
+        slack_channels.append(record)
 
-    # Get a proper list of members for each channel. We're forced to do this by
-    # Slack API changes that don't return the full member list:
-    # https://api.slack.com/changelog/2017-10-members-array-truncating
-    for channel in slack_channels:
         # Querying Slack for members of an empty channel causes an error
         if channel['num_members'] == 0:
-            channel['members'] = []
             continue
 
-        results = slack_api(
-            sc,
-            'conversations.members',
-            limit=500,
-            channel=channel['id'],
-        )
-        channel['members'] = results['members']
-        while results['response_metadata']['next_cursor']:
-            results = slack_api(
-                sc,
-                'conversations.members',
-                limit=500,
-                channel=channel['id'],
-                cursor=results['response_metadata']['next_cursor'],
-            )
-            channel['members'] += results['members']
+        fetch_members(sc, record)
 
         # Make sure all members have been added successfully
-        assert(len(channel['members']) >= channel['num_members'])
+        assert(len(record.members) >= channel['num_members'])
+    log.msg(
+        'Bridging {} channels, ignoring {}'.format(
+            len(slack_channels),
+            len(bridge.ignored_channels),
+        ),
+    )
 
     # Get all users from Slack, but don't select bots, deactivated users, or
     # slackbot, since they don't need IRC bots (they aren't users)
     log.msg('Requesting list of users from Slack...')
     results = slack_api(sc, 'users.list')
     slack_users = [
-        m for m in results['members']
+        SlackUser.from_dict(m) for m in results['members']
         if not m['is_bot']
         and not m['deleted']
         and m['name'] != 'slackbot'
     ]
 
+    # PMs from IRC are posted to each user's IM with the bridge, so get all
+    # of those up front instead of opening each one on its first PM
+    log.msg('Requesting list of IMs from Slack...')
+    fetch_im_channels(bridge)
+    log.msg(f'Found {len(bridge.im_channels)} IMs')
+
+    if capture_rtm:
+        bridge.rtm_recorder = RTMRecorder(
+            capture_rtm,
+            slack_users,
+            slack_channels,
+        )
+
     # Main IRC bot thread
     nickserv_pass = conf.get('irc', 'nickserv_pass')
+    irc_host = conf.get('irc', 'host', fallback='') or default_irc_host()
+    irc_port = conf.getint('irc', 'port', fallback=IRC_PORT)
+    presence = PresenceManager(
+        bridge.users,
+        window=conf.getfloat('presence', 'window', fallback=10),
+        rate=conf.getint('presence', 'rate', fallback=20),
+    )
+    relayed = MessageIndex(
+        maxsize=conf.getint('edits', 'history_size', fallback=5000),
+        max_age=conf.getfloat('edits', 'history_age', fallback=3600),
+    )
+    metrics.caches[bridge.metric('relayed_messages')] = relayed.stats
+    # Post messages from IRC to Slack from worker threads
+    bridge.slack_poster = SlackPoster(
+        bridge,
+        pool,
+        max_pending=conf.getint('slack', 'max_pending_posts', fallback=5000),
+    )
+    ca_file = conf.get('irc', 'ca_file', fallback='')
+    tls = tls_contexts.get((irc_host, ca_file))
+    if tls is None:
+        tls = SharedClientTLS.from_ca_file(irc_host, ca_file)
+        tls_contexts[irc_host, ca_file] = tls
     bridge_factory = BridgeBotFactory(
-        sc, BRIDGE_NICKNAME, nickserv_pass, slack_uid,
-        slack_channels, slack_users,
+        bridge,
+        conf.get('irc', 'bridge_nick', fallback=BRIDGE_NICKNAME),
+        nickserv_pass,
+        slack_channels, slack_users, presence, relayed, irc_host, irc_port,
+        tls,
     )
-    reactor.connectSSL(
-        IRC_HOST, IRC_PORT, bridge_factory, ssl.ClientContextFactory(),
+    reactor.connectSSL(irc_host, irc_port, bridge_factory, tls)
+
+    reloader.on_change(
+        ('channels',),
+        lambda conf: bridge_factory.set_channel_policy(
+            ChannelPolicy.from_config(conf),
+            lambda record: fetch_members(sc, record, checked_slack_api),
+        ),
     )
-    reactor.run()
+    reloader.on_change(
+        ('irc',),
+        lambda conf: bridge_factory.set_nickserv_password(
+            conf.get('irc', 'nickserv_pass'),
+        ),
+    )
+    reloader.on_change(
+        ('slack',),
+        lambda conf: set_attrs(
+            bridge.slack_poster,
+            max_pending=conf.getint(
+                'slack', 'max_pending_posts', fallback=5000,
+            ),
+        ),
+    )
+    reloader.on_change(
+        ('presence',),
+        lambda conf: set_attrs(
+            presence,
+            window=conf.getfloat('presence', 'window', fallback=10),
+            rate=conf.getint('presence', 'rate', fallback=20),
+        ),
+    )
+    reloader.on_change(
+        ('edits',),
+        lambda conf: set_attrs(
+            relayed,
+            maxsize=conf.getint('edits', 'history_size', fallback=5000),
+            max_age=conf.getfloat('edits', 'history_age', fallback=3600),
+        ),
+    )
+    return bridge_factory
+
+
+def fetch_members(
+    sc: SlackClient,
+    record: SlackChannel,
+    api: Callable[..., Any] = slack_api,
+) -> None:
+    """Get a proper list of members for a channel. We're forced to do this by
+    Slack API changes that don't return the full member list:
+    https://api.slack.com/changelog/2017-10-members-array-truncating
+
+    api makes the calls, which exits on errors by default (at startup there's
+    nothing to fall back to), pass checked_slack_api to raise instead."""
+    members = api(
+        sc,
+        'conversations.members',
+        limit=500,
+        channel=record.id,
+    )
+    record.members.update(map(sys.intern, members['members']))
+    while members['response_metadata']['next_cursor']:
+        members = api(
+            sc,
+            'conversations.members',
+            limit=500,
+            channel=record.id,
+            cursor=members['response_metadata']['next_cursor'],
+        )
+        record.members.update(map(sys.intern, members['members']))
+
+
+def fetch_im_channels(bridge: Bridge) -> None:
+    """Get the IM channel between the bridge and every user it has one with,
+    so that PMs from IRC can be posted without calling conversations.open.
+
+    This is only a cache, so if it can't be filled in (the token may not have
+    the im:read scope, for instance), the bridge carries on without it and
+    opens IM channels as PMs are sent instead.
+    """
+    params: dict[str, Any] = {'types': 'im', 'limit': 1000}
+    while True:
+        try:
+            ims = bridge.sc.api_call('conversations.list', **params)
+        except Exception:
+            log.err(None, 'Could not list IMs, opening them when needed')
+            return
+        if not ims.get('ok'):
+            log.err(
+                f'Could not list IMs, opening them when needed: '
+                f'{ims.get("error")}',
+            )
+            return
+        for im in ims['channels']:
+            bridge.im_channels[im['user']] = im['id']
+        params['cursor'] = ims.get('response_metadata', {}).get('next_cursor')
+        if not params['cursor']:
+            break
+
+
+def set_attrs(obj: Any, **values: Any) -> None:
+    for name, value in values.items():
+        setattr(obj, name, value)
 
 
 if __name__ == '__main__':
@@ -7,9 +7,14 @@ import time
 from typing import Any
 from typing import TYPE_CHECKING
 
-import requests
 from twisted.python import log
 
+import slackbridge.utils as utils
+from slackbridge.history import format_correction
+from slackbridge.history import RelayedMessage
+from slackbridge.metrics import timed
+from slackbridge.records import SlackUser
+
 if TYPE_CHECKING:
     from slackbridge.bots import BridgeBot
     from slackbridge.bots import UserBot
@@ -26,11 +31,52 @@ IGNORED_MSG_SUBTYPES = (
 
 FILEHOST = 'https://fluffy.cc'
 
+# The only fields of RTM events that are ever read. Everything else (blocks,
+# attachments, edited info, etc.) is dropped when the event is queued.
+MESSAGE_FIELDS = (
+    'type',
+    'subtype',
+    'user',
+    'channel',
+    'text',
+    'ts',
+    'files',
+    'presence',
+    'users',
+    'bot_id',
+    'message',
+    'deleted_ts',
+)
+
+# Subtypes for edits and deletes of earlier messages, which are relayed as
+# corrections if the original message was recently sent to IRC
+EDIT_MSG_SUBTYPES = (
+    'message_changed',
+    'message_deleted',
+)
+
+# DMs to the bridge are sent to IRC users as "nick: message"
+DM_RECIPIENT = re.compile('^(([^:]+):).*$')
+
 
 @functools.total_ordering
 class SlackMessage:
+    __slots__ = ('raw_message', 'bridge_bot', 'deferred', 'timestamp')
+
     def __init__(self, raw_message: dict[str, Any], bridge_bot: BridgeBot):
-        self.raw_message = raw_message
+        self.raw_message = {
+            field: raw_message[field]
+            for field in MESSAGE_FIELDS
+            if field in raw_message
+        }
+        if 'message' in self.raw_message:
+            # The new version of an edited message, which otherwise comes with
+            # everything a full message event does
+            edited = self.raw_message['message']
+            self.raw_message['message'] = {
+                'ts': edited.get('ts'),
+                'text': edited.get('text', ''),
+            }
         self.bridge_bot = bridge_bot
         self.deferred = False
 
@@ -39,7 +85,26 @@ class SlackMessage:
         else:
             self.timestamp = time.time()
 
+    @timed('SlackMessage.resolve')
     def resolve(self) -> None:
+        bridge = self.bridge_bot.bridge
+        # Nothing from ignored channels is bridged, so skip everything else
+        channel = self.raw_message.get('channel')
+        if (
+            isinstance(channel, str) and
+            channel in bridge.ignored_channels
+        ):
+            return
+
+        if self.raw_message.get('type') == 'presence_change':
+            self._change_presence()
+            return
+
+        # Edits and deletes don't have a user, the original message did
+        if self.raw_message.get('subtype') in EDIT_MSG_SUBTYPES:
+            self._relay_edit()
+            return
+
         if (
             'type' not in self.raw_message or
             'user' not in self.raw_message or
@@ -52,33 +117,28 @@ class SlackMessage:
 
         if message_type == 'team_join':
             """Instantiate a new bot user with the user's information"""
-            self.bridge_bot.factory.instantiate_bot(user)
+            self.bridge_bot.factory.instantiate_bot(SlackUser.from_dict(user))
             return
 
-        if not isinstance(user, str) or user not in self.bridge_bot.users:
+        if not isinstance(user, str) or user not in bridge.users:
             return
 
-        user_bot = self.bridge_bot.users[user]
-
-        if message_type == 'presence_change':
-            self._change_presence(user_bot)
-            return
+        user_bot = bridge.users[user]
 
         channel_id = self.raw_message.get('channel')
         if not channel_id or not isinstance(channel_id, str):
             return
 
         if channel_id[0] == 'D':  # DM channels start with a D
-            if not user_bot.im_id:
-                user_bot.im_id = channel_id
+            bridge.im_channels.setdefault(user, channel_id)
 
             if 'text' in self.raw_message:
-                match = re.search('^(([^:]+):).*$', self.raw_message['text'])
+                match = DM_RECIPIENT.search(self.raw_message['text'])
                 if match:
                     rcpt = match.group(2)
 
-                    if rcpt in self.bridge_bot.irc_users and self.deferred:
-                        irc_user = self.bridge_bot.irc_users[rcpt]
+                    if rcpt in bridge.irc_users and self.deferred:
+                        irc_user = bridge.irc_users[rcpt]
                         if irc_user.authenticated:
 
                             msg = self.raw_message['text']
@@ -104,10 +164,10 @@ class SlackMessage:
                         # Afterwards this message is re-resolved
                         self.deferred = True
 
-                        if rcpt not in self.bridge_bot.irc_users:
-                            self.bridge_bot.irc_users[rcpt] = IRCUser()
+                        if rcpt not in bridge.irc_users:
+                            bridge.irc_users[rcpt] = IRCUser()
 
-                        self.bridge_bot.irc_users[rcpt].add_message(self)
+                        bridge.irc_users[rcpt].add_message(self)
 
                         self.bridge_bot.authenticate(rcpt)
 
@@ -122,8 +182,8 @@ class SlackMessage:
                         resp, False,
                     )
 
-        elif channel_id in self.bridge_bot.channels:
-            channel_name = self.bridge_bot.channels[channel_id]['name']
+        elif channel_id in bridge.channels:
+            channel_name = bridge.channels[channel_id].name
             if message_type == 'message':
                 if 'subtype' in self.raw_message:
                     subtype = self.raw_message['subtype']
@@ -142,7 +202,6 @@ class SlackMessage:
                         file,
                     )
 
-                log.msg('Posting message to IRC')
                 self._post_to_irc(channel_name, user_bot)
             elif message_type == 'member_joined_channel':
                 user_bot.join(channel_name)
@@ -158,11 +217,62 @@ class SlackMessage:
             self.raw_message['bot_id'] is not None
         )
 
-    def _change_presence(self, user_bot: UserBot) -> None:
-        if self.raw_message['presence'] == 'away':
-            user_bot.away('Slack user inactive.')
-        elif self.raw_message['presence'] == 'active':
-            user_bot.back()
+    def _change_presence(self) -> None:
+        """Hand presence changes to the presence manager, which debounces them
+        before sending anything to IRC. With batch_presence_aware set, Slack
+        sends a single event with a list of users instead of one per user."""
+        user_ids = self.raw_message.get('users') or [
+            self.raw_message.get('user'),
+        ]
+        users = self.bridge_bot.bridge.users
+        for user_id in user_ids:
+            if isinstance(user_id, str) and user_id in users:
+                self.bridge_bot.presence.update(
+                    user_id,
+                    self.raw_message['presence'],
+                )
+
+    def _relay_edit(self) -> None:
+        """Send a correction to IRC for an edited message, or note that it was
+        deleted. Only messages still in the bridge's index of what it relayed
+        are handled, anything older has scrolled away on IRC anyway."""
+        channel_id = self.raw_message.get('channel')
+        if not isinstance(channel_id, str):
+            return
+
+        bridge = self.bridge_bot.bridge
+        relayed = self.bridge_bot.relayed
+        if self.raw_message['subtype'] == 'message_changed':
+            ts = self.raw_message.get('message', {}).get('ts')
+            original = relayed.get(channel_id, ts) if ts else None
+        else:
+            ts = self.raw_message.get('deleted_ts')
+            original = relayed.pop(channel_id, ts) if ts else None
+        if original is None or original.user_id not in bridge.users:
+            return
+
+        user_bot = bridge.users[original.user_id]
+        if self.raw_message['subtype'] == 'message_deleted':
+            minutes = int(time.monotonic() - original.sent_at) // 60
+            when = f'{minutes} min ago' if minutes else 'just now'
+            self._irc_me_action(
+                original.channel_name,
+                user_bot,
+                f'deleted a message from {when}',
+            )
+            return
+
+        text = utils.format_irc_message(
+            self.raw_message['message']['text'],
+            bridge.users,
+            bridge.bots,
+            bridge.known_channels,
+        )
+        correction = format_correction(original.text, text)
+        if correction is not None:
+            # Later edits are compared against this one
+            original.text = text
+            user_bot.msg('#' + original.channel_name, correction)
 
     def _irc_me_action(
         self,
@@ -182,10 +292,14 @@ class SlackMessage:
         user_bot: UserBot,
         file_data: dict[str, Any],
     ) -> None:
+        # Only imported when needed, since files are rare and requests is
+        # slow to import
+        import requests
+
         # Adapted from https://api.slack.com/tutorials/working-with-files
         auth = {
             'Authorization': 'Bearer {}'.format(
-                self.bridge_bot.slack_token,
+                self.bridge_bot.bridge.slack_token,
             ),
         }
         r = requests.get(
@@ -250,12 +364,25 @@ class SlackMessage:
         )
 
     def _post_to_irc(self, channel_name: str, user_bot: UserBot) -> None:
-        for line in self.raw_message['text'].splitlines():
+        sent = [
             user_bot.post_to_irc(
                 user_bot.msg,
                 '#' + channel_name,
                 line,
             )
+            for line in self.raw_message['text'].splitlines()
+        ]
+        if 'ts' in self.raw_message:
+            # Remember what was sent so that later edits can be relayed
+            self.bridge_bot.relayed.add(
+                self.raw_message['channel'],
+                self.raw_message['ts'],
+                RelayedMessage(
+                    user_bot.user_id,
+                    channel_name,
+                    '\n'.join(sent),
+                ),
+            )
 
     def _post_pm_to_irc(self, irc_recipient: str, user_bot: UserBot) -> None:
         for line in self.raw_message['text'].splitlines():
@@ -279,6 +406,7 @@ class SlackMessage:
 
 
 class IRCUser:
+    __slots__ = ('authenticated', 'messages')
 
     def __init__(self, authenticated: bool = False):
         self.authenticated = authenticated
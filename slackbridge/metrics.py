@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from collections import Counter
+from typing import Any
+from typing import Callable
+from typing import cast
+from typing import TypeVar
+
+from slackbridge.cache import cache_stats
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Timing:
+    """Running totals for how long a named piece of code takes.
+
+    Some of this code runs in the Slack post threads as well as the reactor,
+    so the totals are only updated under a lock.
+    """
+    __slots__ = ('count', 'total', 'max', 'lock')
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, elapsed: float) -> None:
+        with self.lock:
+            self.count += 1
+            self.total += elapsed
+            if elapsed > self.max:
+                self.max = elapsed
+
+    def to_dict(self) -> dict[str, Any]:
+        with self.lock:
+            count, total, max_ = self.count, self.total, self.max
+        return {
+            'count': count,
+            'total': round(total, 6),
+            'mean': round(total / count, 6) if count else 0,
+            'max': round(max_, 6),
+        }
+
+
+timings: dict[str, Timing] = {}
+# Name -> function returning the current stats (hits, misses, etc.) of a cache
+caches: dict[str, Callable[[], dict[str, Any]]] = {}
+# Counts of things that happened, like events that were dropped
+counters: Counter[str] = Counter()
+# Name -> function returning a current value, like the length of a queue
+gauges: dict[str, Callable[[], float]] = {}
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Record how long each call to the decorated function takes under the
+    given name, so that hot paths can be compared without a full profile"""
+    timing = timings.setdefault(name, Timing())
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timing.record(time.perf_counter() - start)
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def register_lru_cache(name: str, func: Any) -> None:
+    """Report the hit rate of a function wrapped with functools.lru_cache"""
+    def stats() -> dict[str, Any]:
+        info = func.cache_info()
+        return cache_stats(info.hits, info.misses, info.currsize, info.maxsize)
+    caches[name] = stats
+
+
+def snapshot() -> dict[str, Any]:
+    return {
+        'timings': {
+            name: timing.to_dict() for name, timing in timings.items()
+        },
+        'caches': {name: stats() for name, stats in caches.items()},
+        'counters': dict(counters),
+        'gauges': {name: gauge() for name, gauge in gauges.items()},
+    }
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any
+from typing import Collection
+from typing import TYPE_CHECKING
+
+from twisted.internet import reactor
+from twisted.internet import threads
+from twisted.python import log
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+import slackbridge.metrics as metrics
+import slackbridge.utils as utils
+
+if TYPE_CHECKING:
+    from slackclient import SlackClient
+
+    from slackbridge.bridge import Bridge
+
+post_wait = metrics.timings.setdefault('slack_post_wait', metrics.Timing())
+post_time = metrics.timings.setdefault('slack_post', metrics.Timing())
+
+
+class OutboundMessage:
+    """A message from IRC, parsed but not yet formatted for Slack"""
+    __slots__ = ('nick', 'channel', 'text', 'queued_at')
+
+    def __init__(self, nick: str, channel: str, text: str):
+        self.nick = nick
+        self.channel = channel
+        self.text = text
+        self.queued_at = time.perf_counter()
+
+
+def send_to_slack(
+    sc: SlackClient,
+    message: OutboundMessage,
+    slack_names: Collection[str],
+) -> tuple[dict[str, Any], float, float]:
+    """Format and post a message, returning Slack's response and when the
+    post started and finished. This runs in a worker thread."""
+    started = time.perf_counter()
+    response = sc.api_call(
+        'chat.postMessage',
+        **utils.format_slack_post(
+            message.nick,
+            message.channel,
+            message.text,
+            slack_names,
+        ),
+    )
+    return response, started, time.perf_counter()
+
+
+def start_pool(workers: int) -> ThreadPool:
+    """Start the threads that every bridge in the process posts to Slack
+    from, which are stopped along with the reactor"""
+    pool = ThreadPool(minthreads=0, maxthreads=workers, name='slack')
+    pool.start()
+    reactor.addSystemEventTrigger('during', 'shutdown', pool.stop)
+    return pool
+
+
+class SlackPoster:
+    """Formats and posts a bridge's messages from IRC to Slack in a pool of
+    threads (which can be shared with other bridges).
+
+    The reactor only queues messages, so a slow Slack API can't hold up every
+    bot's IRC connection. Each channel has its own queue, and only one of its
+    messages is being posted at a time, so messages in a channel stay in
+    order while different channels are posted to in parallel. At most
+    `max_pending` messages are queued in total, and anything past that is
+    dropped (and counted) rather than using up memory without bound.
+
+    Slack's response to every message that was posted is handed to the
+    bridge on the reactor thread.
+    """
+
+    def __init__(
+        self,
+        bridge: Bridge,
+        pool: ThreadPool,
+        max_pending: int = 5000,
+    ):
+        self.bridge = bridge
+        self.pool = pool
+        self.max_pending = max_pending
+        self.queues: dict[str, deque[OutboundMessage]] = {}
+        self.pending = 0
+        self.max_seen = 0
+
+        gauges = {
+            'slack_posts_pending': lambda: self.pending,
+            'slack_posts_max_pending': lambda: self.max_seen,
+            'slack_channels_posting': lambda: len(self.queues),
+        }
+        for name, gauge in gauges.items():
+            metrics.gauges[bridge.metric(name)] = gauge
+
+    def post(self, nick: str, channel: str, text: str) -> None:
+        if self.pending >= self.max_pending:
+            metrics.counters[self.bridge.metric('slack_posts_dropped')] += 1
+            log.msg('Too many messages waiting for Slack, dropping one')
+            return
+
+        self.pending += 1
+        self.max_seen = max(self.max_seen, self.pending)
+        message = OutboundMessage(nick, channel, text)
+        if channel in self.queues:
+            # Something is already being posted to this channel, so this
+            # will be posted once everything before it is
+            self.queues[channel].append(message)
+        else:
+            self.queues[channel] = deque()
+            self._send(message)
+
+    def _send(self, message: OutboundMessage) -> None:
+        d = threads.deferToThreadPool(
+            reactor,
+            self.pool,
+            send_to_slack,
+            self.bridge.sc,
+            message,
+            self.bridge.slack_names,
+        )
+        d.addCallback(self._sent, message)
+        d.addErrback(self._failed, message)
+        d.addBoth(self._next, message.channel)
+
+    def _sent(
+        self,
+        result: tuple[dict[str, Any], float, float],
+        message: OutboundMessage,
+    ) -> None:
+        response, started, finished = result
+        post_wait.record(started - message.queued_at)
+        post_time.record(finished - started)
+        self.bridge.posted_to_slack(message.channel, response)
+
+    def _failed(self, failure: Failure, message: OutboundMessage) -> None:
+        log.err(failure, f'Posting to Slack in {message.channel} failed')
+
+    def _next(self, result: Any, channel: str) -> None:
+        self.pending -= 1
+        queue = self.queues[channel]
+        if queue:
+            self._send(queue.popleft())
+        else:
+            del self.queues[channel]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from configparser import ConfigParser
+from fnmatch import fnmatchcase
+
+# Messages go both ways
+BRIDGED = 'bridged'
+# Messages from Slack are shown on IRC, but nothing from IRC goes to Slack
+READ_ONLY = 'read-only'
+# Not joined or bridged at all, and no member lists are fetched for it
+IGNORED = 'ignored'
+
+MODES = (BRIDGED, READ_ONLY, IGNORED)
+
+
+class ChannelPolicy:
+    """How each Slack channel is bridged, from the [channels] section of the
+    config. Options are channel names or glob patterns, and values are one of
+    MODES. An exact name wins over any pattern, and patterns are tried in the
+    order they are listed. The "default" option applies to every channel that
+    doesn't match anything else, and is "bridged" if it isn't set.
+    """
+
+    def __init__(
+        self,
+        rules: list[tuple[str, str]] | None = None,
+        default: str = BRIDGED,
+    ):
+        self.default = default
+        self.exact: dict[str, str] = {}
+        self.patterns: list[tuple[str, str]] = []
+        for pattern, mode in rules or []:
+            if mode not in MODES:
+                raise ValueError(
+                    f'Unknown mode "{mode}" for channel "{pattern}", '
+                    f'must be one of {", ".join(MODES)}',
+                )
+            if any(c in pattern for c in '*?['):
+                self.patterns.append((pattern, mode))
+            else:
+                self.exact[pattern] = mode
+        if default not in MODES:
+            raise ValueError(f'Unknown default channel mode "{default}"')
+
+        # Channel names don't change often, so matching the patterns once per
+        # channel is enough
+        self.modes: dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, conf: ConfigParser) -> ChannelPolicy:
+        if not conf.has_section('channels'):
+            return cls()
+        rules = [
+            (name, mode.strip().lower())
+            for name, mode in conf.items('channels', raw=True)
+            if name != 'default'
+        ]
+        default = conf.get('channels', 'default', fallback=BRIDGED)
+        return cls(rules, default.strip().lower())
+
+    def mode(self, channel_name: str) -> str:
+        mode = self.modes.get(channel_name)
+        if mode is None:
+            mode = self.exact.get(channel_name)
+            if mode is None:
+                mode = next(
+                    (
+                        mode for pattern, mode in self.patterns
+                        if fnmatchcase(channel_name, pattern)
+                    ),
+                    self.default,
+                )
+            self.modes[channel_name] = mode
+        return mode
+
+    def ignored(self, channel_name: str) -> bool:
+        return self.mode(channel_name) == IGNORED
+
+    def read_only(self, channel_name: str) -> bool:
+        return self.mode(channel_name) == READ_ONLY
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+from typing import TYPE_CHECKING
+
+from twisted.internet import reactor
+
+if TYPE_CHECKING:
+    from slackbridge.bots import UserBot
+
+
+class PresenceManager:
+    """Debounces Slack presence changes before they're sent to IRC as AWAY.
+
+    Lots of users go active or away at the same time (in the morning, around
+    lunch, etc.) and some flap back and forth, so instead of sending an AWAY
+    for every presence_change event, only the latest presence of each user is
+    kept. It's applied once it has been pending for `window` seconds, and only
+    if it's different from what IRC already shows. At most `rate` AWAY
+    commands are sent per second across all user bots, and anything over that
+    stays queued for the next second.
+    """
+
+    def __init__(
+        self,
+        users: dict[str, UserBot],
+        window: float = 10,
+        rate: int = 20,
+    ):
+        self.users = users
+        self.window = window
+        self.rate = rate
+        # user id -> (latest presence, when the first pending change came in)
+        self.pending: dict[str, tuple[str, float]] = {}
+        self.flush_call: Any = None
+
+    def update(self, user_id: str, presence: str) -> None:
+        if user_id in self.pending:
+            # Keep the original time so constant flapping can't starve a user
+            self.pending[user_id] = (presence, self.pending[user_id][1])
+        else:
+            self.pending[user_id] = (presence, time.monotonic())
+        self._schedule(self.window)
+
+    def _schedule(self, delay: float) -> None:
+        if self.flush_call is None or not self.flush_call.active():
+            self.flush_call = reactor.callLater(delay, self.flush)
+
+    def flush(self) -> None:
+        cutoff = time.monotonic() - self.window
+        sent = 0
+
+        # Dicts keep insertion order, so this goes from oldest to newest
+        for user_id, (presence, since) in list(self.pending.items()):
+            if since > cutoff or sent >= self.rate:
+                break
+            del self.pending[user_id]
+
+            user_bot = self.users.get(user_id)
+            if user_bot is None or user_bot.presence == presence:
+                # Flapped back to where it started, or the bot is gone
+                continue
+
+            if presence == 'away':
+                user_bot.away('Slack user inactive.')
+            elif presence == 'active':
+                user_bot.back()
+            else:
+                continue
+            user_bot.presence = presence
+            sent += 1
+
+        if self.pending:
+            oldest = next(iter(self.pending.values()))[1]
+            self._schedule(max(1, oldest + self.window - time.monotonic()))
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from configparser import ConfigParser
+from types import FrameType
+from typing import Any
+from typing import Callable
+from typing import Collection
+from typing import TYPE_CHECKING
+
+from twisted.internet import reactor
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+from twisted.python import log
+
+import slackbridge.metrics as metrics
+
+if TYPE_CHECKING:
+    from slackbridge.bridge import Bridge
+
+
+def approx_size(container: Collection[Any]) -> int:
+    """Size of a container and the entries directly in it. This doesn't follow
+    references any deeper, since that would walk into the reactor, factories,
+    etc. and count everything many times over."""
+    size = sys.getsizeof(container)
+    if isinstance(container, dict):
+        for key, value in container.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    else:
+        for item in container:
+            size += sys.getsizeof(item)
+    return size
+
+
+class Profiler:
+    """Runtime profiling controls for a running bridge.
+
+    Send SIGUSR1 to start a cProfile run and SIGUSR1 again to stop it and write
+    the stats out, or SIGUSR2 to dump the stacks of all threads. The same
+    commands (and a tracemalloc snapshot) are also available over the admin
+    socket if one is configured, e.g.
+
+        echo memory | socat - UNIX-CONNECT:/run/slackbridge/admin.sock
+    """
+
+    def __init__(self, dump_dir: str):
+        self.dump_dir = dump_dir
+        self.profile: cProfile.Profile | None = None
+        # Bridges whose lookup tables and queues are in memory snapshots
+        self.bridges: list[Bridge] = []
+
+    def _dump_path(self, kind: str, extension: str) -> str:
+        filename = 'slackbridge-{}-{}.{}'.format(
+            kind,
+            time.strftime('%Y%m%d-%H%M%S'),
+            extension,
+        )
+        return os.path.join(self.dump_dir, filename)
+
+    def configure(self, conf: ConfigParser) -> None:
+        """Apply changes to the [profiling] section on a config reload"""
+        self.dump_dir = conf.get('profiling', 'dump_dir', fallback='/tmp')
+        trace = conf.getboolean('profiling', 'tracemalloc', fallback=False)
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def install_signal_handlers(self) -> None:
+        # Signal handlers can run in the middle of any other code, so just
+        # schedule the work to happen on the reactor instead
+        def on_usr1(signum: int, frame: FrameType | None) -> None:
+            reactor.callFromThread(self.toggle_profile)
+
+        def on_usr2(signum: int, frame: FrameType | None) -> None:
+            reactor.callFromThread(self.dump_stacks)
+
+        signal.signal(signal.SIGUSR1, on_usr1)
+        signal.signal(signal.SIGUSR2, on_usr2)
+
+    def listen(self, socket_path: str) -> None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        reactor.listenUNIX(socket_path, AdminFactory(self), mode=0o600)
+        log.msg(f'Listening for admin commands on {socket_path}')
+
+    def toggle_profile(self) -> str:
+        if self.profile is None:
+            return self.start_profile()
+        else:
+            return self.stop_profile()
+
+    def start_profile(self) -> str:
+        if self.profile is not None:
+            return 'Already profiling'
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        log.msg('Started profiling')
+        return 'Started profiling'
+
+    def stop_profile(self) -> str:
+        if self.profile is None:
+            return 'Not profiling'
+        self.profile.disable()
+        path = self._dump_path('profile', 'prof')
+        self.profile.dump_stats(path)
+        self.profile = None
+        log.msg(f'Stopped profiling, wrote stats to {path}')
+        return path
+
+    def dump_stacks(self) -> str:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        lines = []
+        for ident, frame in sys._current_frames().items():
+            lines.append(f'Thread {names.get(ident, ident)}:\n')
+            lines.extend(traceback.format_stack(frame))
+            lines.append('\n')
+
+        path = self._dump_path('stacks', 'txt')
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        log.msg(f'Wrote stacks of all threads to {path}')
+        return path
+
+    def memory_snapshot(self) -> str:
+        """Write the biggest allocation sites along with the size of the
+        bridge's long-lived lookup tables and queues"""
+        if not tracemalloc.is_tracing():
+            # Only allocations made after this point will show up, so this
+            # is better enabled at startup with tracemalloc=true in the config
+            tracemalloc.start()
+
+        snapshot = tracemalloc.take_snapshot()
+        top_stats = snapshot.statistics('lineno')[:25]
+
+        containers: dict[str, Collection[Any]] = {}
+        for bridge in self.bridges:
+            containers[bridge.metric('users')] = bridge.users
+            containers[bridge.metric('irc_users')] = bridge.irc_users
+            containers[bridge.metric('channels')] = bridge.channels
+            for uid, bot in bridge.bots.items():
+                containers[bridge.metric(f'message_queue[{uid}]')] = (
+                    bot.message_queue.queue
+                )
+            containers[bridge.metric('deferred PMs')] = [
+                message
+                for irc_user in bridge.irc_users.values()
+                for message in irc_user.messages
+            ]
+
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            'traced_bytes': {'current': current, 'peak': peak},
+            'containers': {
+                name: {'len': len(c), 'approx_bytes': approx_size(c)}
+                for name, c in containers.items()
+            },
+            'top_allocations': [str(stat) for stat in top_stats],
+        }
+
+        path = self._dump_path('memory', 'json')
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        log.msg(f'Wrote memory snapshot to {path}')
+        return path
+
+
+class AdminProtocol(LineReceiver):
+    delimiter = b'\n'
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+        self.commands: dict[str, Callable[[], str]] = {
+            'profile start': profiler.start_profile,
+            'profile stop': profiler.stop_profile,
+            'stacks': profiler.dump_stacks,
+            'memory': profiler.memory_snapshot,
+            'timings': lambda: json.dumps(metrics.snapshot()),
+        }
+
+    def lineReceived(self, line: bytes) -> None:
+        command = line.decode(errors='replace').strip()
+        if command in self.commands:
+            response = self.commands[command]()
+        else:
+            response = 'Commands: ' + ', '.join(self.commands)
+        self.sendLine(response.encode())
+
+
+class AdminFactory(Factory):
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    def buildProtocol(self, addr: Any) -> AdminProtocol:
+        p = AdminProtocol(self.profiler)
+        p.factory = self
+        return p
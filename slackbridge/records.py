@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import sys
+from typing import Any
+
+
+class SlackUser:
+    """The parts of a Slack user object that the bridge uses. The full objects
+    from users.list have a big profile dict attached that we never read, so
+    only these fields are kept around for the lifetime of each user bot."""
+    __slots__ = ('id', 'name', 'real_name')
+
+    def __init__(self, id: str, name: str, real_name: str):
+        self.id = sys.intern(id)
+        self.name = name
+        self.real_name = real_name
+
+    @classmethod
+    def from_dict(cls, user: dict[str, Any]) -> SlackUser:
+        return cls(user['id'], user['name'], user.get('real_name', ''))
+
+
+class SlackChannel:
+    """The parts of a Slack channel object that the bridge uses.
+
+    Member ids are interned, so that each id string is only stored once no
+    matter how many channels the user is a member of, and kept in a set to
+    make membership checks cheap. num_members is how many members Slack said
+    the channel had when it was listed.
+    """
+    __slots__ = ('id', 'name', 'topic', 'members', 'num_members')
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        topic: str = '',
+        members: set[str] | None = None,
+        num_members: int = 0,
+    ):
+        self.id = sys.intern(id)
+        self.name = name
+        self.topic = topic
+        self.members: set[str] = members if members is not None else set()
+        self.num_members = num_members
+
+    @classmethod
+    def from_dict(cls, channel: dict[str, Any]) -> SlackChannel:
+        return cls(
+            channel['id'],
+            channel['name'],
+            channel.get('topic', {}).get('value', ''),
+            {sys.intern(member) for member in channel.get('members', [])},
+            channel.get('num_members', 0),
+        )
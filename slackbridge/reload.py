@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import signal
+from configparser import ConfigParser
+from configparser import Error as ConfigError
+from types import FrameType
+from typing import Callable
+
+from twisted.internet import reactor
+from twisted.python import log
+
+# Options that are only read at startup, changing them needs a restart
+RESTART_OPTIONS = {
+    ('slack', 'token'),
+    ('slack', 'user'),
+    # Every bot would have to reconnect, so this might as well be a restart
+    ('irc', 'host'),
+    ('irc', 'port'),
+    ('irc', 'ca_file'),
+    ('irc', 'bridge_nick'),
+    ('health', 'port'),
+    ('logging', 'format'),
+    ('profiling', 'admin_socket'),
+}
+
+Handler = Callable[[ConfigParser], None]
+
+
+def config_items(conf: ConfigParser) -> dict[tuple[str, str], str]:
+    return {
+        (section, option): value
+        for section in conf.sections()
+        for option, value in conf.items(section, raw=True)
+    }
+
+
+class ConfigReloader:
+    """Re-reads the config file on SIGHUP and applies only what changed.
+
+    Each part of the bridge that can be changed while running registers a
+    handler for the config sections it reads from, and the handler is called
+    with the new config only if something in one of those sections changed.
+    That way, changing a tuning knob doesn't touch anything else, and in
+    particular doesn't reconnect any bots that don't need to be.
+
+    If the file can't be parsed, the old config is kept as it is. If a
+    handler fails, its sections are treated as changed on the next reload
+    too, so that it's tried again even if the file is the same. When
+    running several bridges, each of their config files has its own reloader,
+    and a SIGHUP reloads all of them.
+    """
+
+    def __init__(self, path: str, conf: ConfigParser):
+        self.path = path
+        self.conf = conf
+        self.handlers: list[tuple[frozenset[str], Handler]] = []
+        # Sections that a handler failed to apply on the last reload
+        self.failed_sections: set[str] = set()
+
+    def on_change(self, sections: tuple[str, ...], handler: Handler) -> None:
+        self.handlers.append((frozenset(sections), handler))
+
+    def reload(self) -> None:
+        conf = ConfigParser()
+        try:
+            if not conf.read(self.path):
+                log.err(f'Could not read {self.path}, not reloading config')
+                return
+        except ConfigError as e:
+            log.err(f'Could not parse {self.path}, not reloading config: {e}')
+            return
+
+        old, new = config_items(self.conf), config_items(conf)
+        changed = {
+            key for key in old.keys() | new.keys()
+            if old.get(key) != new.get(key)
+        }
+        changed_sections = {section for section, _ in changed}
+        changed_sections |= self.failed_sections
+        if not changed_sections:
+            log.msg('Reloaded config, nothing changed')
+            return
+
+        self.conf = conf
+        if changed:
+            log.msg(
+                'Reloaded config, changed: {}'.format(
+                    ', '.join(sorted(f'{s}.{o}' for s, o in changed)),
+                ),
+            )
+        if self.failed_sections:
+            log.msg(
+                'Retrying config changes to {}'.format(
+                    ', '.join(sorted(self.failed_sections)),
+                ),
+            )
+        for section, option in sorted(changed & RESTART_OPTIONS):
+            log.msg(f'{section}.{option} only takes effect after a restart')
+
+        self.failed_sections = set()
+        for sections, handler in self.handlers:
+            if sections & changed_sections:
+                try:
+                    handler(conf)
+                except Exception:
+                    # Keep applying the rest of the changes, and try this
+                    # again on the next reload
+                    self.failed_sections |= sections
+                    log.err(
+                        None,
+                        'Failed to apply config changes to {}'.format(
+                            ', '.join(sorted(sections)),
+                        ),
+                    )
+
+
+def install_signal_handler(reloaders: list[ConfigReloader]) -> None:
+    # Signal handlers can run in the middle of any other code, so just
+    # schedule the work to happen on the reactor instead
+    def on_hup(signum: int, frame: FrameType | None) -> None:
+        for reloader in reloaders:
+            reactor.callFromThread(reloader.reload)
+
+    signal.signal(signal.SIGHUP, on_hup)
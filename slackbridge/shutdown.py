@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+from typing import TYPE_CHECKING
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python import log
+
+if TYPE_CHECKING:
+    from slackbridge.bots import BridgeBot
+    from slackbridge.factories import BridgeBotFactory
+
+QUIT_MESSAGE = 'Slack bridge restarting'
+
+
+class GracefulShutdown:
+    """Shuts every bridge down cleanly when the reactor is stopped, which
+    Twisted does on SIGTERM (what Kubernetes sends when stopping the pod).
+
+    The reactor waits for the Deferred returned by run() before actually
+    shutting down. In that time:
+
+    1. Bridges stop reading from Slack RTM, and bots stop reconnecting.
+    2. Queued Slack messages, and PMs waiting on a WHOIS, are sent to IRC,
+       and messages from IRC waiting to be posted are posted to Slack, for
+       up to drain_timeout seconds.
+    3. Every user bot, then the bridge bots, send a QUIT, at most quit_rate
+       per second so that the IRC servers don't see a flood of them.
+
+    Everything has to be done within `deadline` seconds, which should be less
+    than the pod's termination grace period, since after that the pod is
+    killed outright. Whatever is left at the deadline is abandoned.
+    """
+
+    def __init__(
+        self,
+        factories: list[BridgeBotFactory],
+        drain_timeout: float = 10,
+        quit_rate: int = 100,
+        deadline: float = 25,
+    ):
+        self.factories = factories
+        self.drain_timeout = drain_timeout
+        self.quit_rate = quit_rate
+        self.deadline = deadline
+        self.done: defer.Deferred[None] | None = None
+
+    def install(self) -> None:
+        reactor.addSystemEventTrigger('before', 'shutdown', self.run)
+
+    def run(self) -> defer.Deferred[None]:
+        log.msg('Shutting down')
+        self.started = time.monotonic()
+        self.done = defer.Deferred()
+        self.timeout = reactor.callLater(self.deadline, self._finish)
+
+        for factory in self.factories:
+            bridge_bot = self._bridge_bot(factory)
+            if bridge_bot is not None:
+                bridge_bot.draining = True
+            factory.stopTrying()
+            for user_factory in factory.user_factories.values():
+                user_factory.stopTrying()
+
+        self._drain(time.monotonic() + self.drain_timeout)
+        return self.done
+
+    def _bridge_bot(self, factory: BridgeBotFactory) -> BridgeBot | None:
+        return factory.bridge.bots.get(factory.slack_uid)
+
+    def _pending(self, factory: BridgeBotFactory) -> int:
+        bridge = factory.bridge
+        bridge_bot = self._bridge_bot(factory)
+        queued = bridge_bot.message_queue.qsize() if bridge_bot else 0
+        deferred = sum(
+            len(user.messages) for user in bridge.irc_users.values()
+        )
+        posting = bridge.slack_poster.pending if bridge.slack_poster else 0
+        return queued + deferred + posting
+
+    def _drain(self, until: float) -> None:
+        for factory in self.factories:
+            bridge_bot = self._bridge_bot(factory)
+            if bridge_bot is not None:
+                bridge_bot.empty_queue()
+
+        pending = sum(self._pending(factory) for factory in self.factories)
+        if pending and time.monotonic() < until:
+            # PMs are only sent once their recipient's WHOIS comes back
+            reactor.callLater(0.1, self._drain, until)
+            return
+        if pending:
+            log.msg(f'Gave up on sending {pending} messages to IRC')
+
+        bots: list[Any] = [
+            bot
+            for factory in self.factories
+            for bot in factory.bridge.users.values()
+            if bot.transport is not None
+        ]
+        for factory in self.factories:
+            bridge_bot = self._bridge_bot(factory)
+            if bridge_bot is not None and bridge_bot.transport is not None:
+                bots.append(bridge_bot)
+        log.msg(f'Sending QUIT for {len(bots)} bots')
+        self._quit(bots)
+
+    def _quit(self, bots: list[Any]) -> None:
+        # Send in batches ten times a second to spread them out evenly
+        batch = max(1, self.quit_rate // 10)
+        for bot in bots[:batch]:
+            bot.quit(QUIT_MESSAGE)
+        if bots[batch:]:
+            reactor.callLater(0.1, self._quit, bots[batch:])
+        else:
+            # Give the server a moment to read the last of them
+            reactor.callLater(0.5, self._finish)
+
+    def _finish(self) -> None:
+        if self.done is None or self.done.called:
+            return
+        if self.timeout.active():
+            self.timeout.cancel()
+        else:
+            log.msg('Ran out of time to shut down cleanly')
+        log.msg(
+            'Shut down in {:.1f} seconds'.format(
+                time.monotonic() - self.started,
+            ),
+        )
+        self.done.callback(None)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Any
+
+from OpenSSL import SSL
+from twisted.internet import ssl
+from twisted.internet.interfaces import IOpenSSLClientConnectionCreator
+from zope.interface import implementer
+
+# How many recent connections to look at for a session to resume
+RECENT_CONNECTIONS = 8
+
+PEM_CERTIFICATE = re.compile(
+    rb'-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----',
+    re.DOTALL,
+)
+
+
+@implementer(IOpenSSLClientConnectionCreator)
+class SharedClientTLS:
+    """TLS settings shared by every connection to the IRC server.
+
+    The certificate and hostname of the server are verified, against the
+    system's trusted CAs unless a trust root (a certificate, or what
+    ssl.trustRootFromCertificates returns) is given. Every connection is
+    made from the same OpenSSL context instead of setting up a new one each
+    time, and resumes the TLS session of an earlier connection if there is
+    one, which saves most of the work of a handshake for both sides. This
+    matters when hundreds of user bots connect at once, at startup or after
+    the IRC server goes away.
+
+    There's no portable way to be told when a session is ready to resume
+    (with TLS 1.3 it only arrives after the handshake), so the most recent
+    connections that finished their handshake are checked for one whenever
+    a new connection is made.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        trust_root: Any = None,
+    ):
+        self.hostname = hostname
+        self.options: Any = ssl.optionsForClientTLS(
+            hostname,
+            trustRoot=trust_root,
+        )
+        self.recent: deque[SSL.Connection] = deque(maxlen=RECENT_CONNECTIONS)
+        self.session: SSL.Session | None = None
+
+    @classmethod
+    def from_ca_file(cls, hostname: str, ca_file: str) -> SharedClientTLS:
+        """Trust only the CA certificates in ca_file (every one of them, for
+        a bundle with intermediates or several roots), or the system's
+        trusted CAs if it's empty"""
+        if not ca_file:
+            return cls(hostname)
+        with open(ca_file, 'rb') as f:
+            pems = PEM_CERTIFICATE.findall(f.read())
+        if not pems:
+            raise ValueError(f'No certificates found in {ca_file}')
+        return cls(
+            hostname,
+            ssl.trustRootFromCertificates(
+                [ssl.Certificate.loadPEM(pem) for pem in pems],
+            ),
+        )
+
+    def _update_session(self) -> None:
+        for connection in reversed(self.recent):
+            # get_finished() is only set once the handshake is done
+            if connection.get_finished() is not None:
+                session = connection.get_session()
+                if session is not None:
+                    self.session = session
+                    self.recent.clear()
+                return
+
+    def clientConnectionForTLS(self, tlsProtocol: Any) -> SSL.Connection:
+        self._update_session()
+        connection = self.options.clientConnectionForTLS(tlsProtocol)
+        if self.session is not None:
+            # If the server doesn't accept it anymore (after a restart, for
+            # instance), this just falls back to a full handshake
+            connection.set_session(self.session)
+        self.recent.append(connection)
+        return connection
@@ -1,27 +1,39 @@
 from __future__ import annotations
 
+import functools
 import getpass
 import hashlib
 import re
 import sys
 from typing import Any
+from typing import Collection
+from typing import Mapping
 from typing import Match
+from typing import TYPE_CHECKING
 
-from emoji import emojize
-from slackclient import SlackClient
 from twisted.python import log
 
+import slackbridge.metrics as metrics
+from slackbridge.metrics import timed
+
+if TYPE_CHECKING:
+    from slackclient import SlackClient
 
-GRAVATAR_URL = 'http://www.gravatar.com/avatar/{}?s=48&r=any&default=identicon'
 
-if getpass.getuser() == 'nobody':
-    IRC_HOST = 'irc.ocf.berkeley.edu'
-else:
-    IRC_HOST = 'dev-irc.ocf.berkeley.edu'
+GRAVATAR_URL = 'http://www.gravatar.com/avatar/{}?s=48&r=any&default=identicon'
 
 IRC_PORT = 6697
 
+# The set of nicks actively talking on IRC and of Slack users is small and
+# doesn't change much, so these are cached to avoid redoing the same string
+# work (and MD5 hashing for Gravatar URLs) on every message
+NICK_CACHE_SIZE = 1024
+
+# The same pattern emoji.emojize uses to find shortcodes like :thumbsup:
+EMOJI_SHORTCODE = re.compile('(:[A-zÀ-ÿ0-9\\-_&.’”“()!#*+?–]+:)')
 
+
+@functools.lru_cache(maxsize=NICK_CACHE_SIZE)
 def user_to_gravatar(user: str) -> str:
     """
     We use Gravatar images for users when they are mirrored as a guess that
@@ -36,6 +48,7 @@ def user_to_gravatar(user: str) -> str:
     return GRAVATAR_URL.format(email_hash.hexdigest())
 
 
+@functools.lru_cache(maxsize=NICK_CACHE_SIZE)
 def strip_nick(nick: str) -> str:
     """
     Strip a given Slack nickname to be IRC bot compatible. For instance, Slack
@@ -56,6 +69,7 @@ def strip_nick(nick: str) -> str:
     )
 
 
+@functools.lru_cache(maxsize=NICK_CACHE_SIZE)
 def nick_from_irc_user(irc_user: str) -> str:
     """
     User is like 'jvperrin!Jason@fireball.ocf.berkeley.edu' (nick!ident@host),
@@ -66,11 +80,51 @@ def nick_from_irc_user(irc_user: str) -> str:
     return irc_user.split('!')[0]
 
 
+metrics.register_lru_cache('user_to_gravatar', user_to_gravatar)
+metrics.register_lru_cache('strip_nick', strip_nick)
+metrics.register_lru_cache('nick_from_irc_user', nick_from_irc_user)
+
+
+@functools.lru_cache(maxsize=None)
+def emoji_table() -> dict[str, str]:
+    """
+    Shortcode (including aliases, like ":thumbsup:") to unicode emoji table,
+    shared by everything that needs it. This is only built the first time an
+    emoji shows up, since importing the emoji package's tables (in every
+    language) is one of the slower parts of starting up.
+    """
+    try:
+        from emoji.unicode_codes import EMOJI_ALIAS_UNICODE_ENGLISH
+        return dict(EMOJI_ALIAS_UNICODE_ENGLISH)
+    except ImportError:
+        # emoji 2.0 and later no longer have a prebuilt alias table
+        from emoji import EMOJI_DATA
+        table = {}
+        for emoji, data in EMOJI_DATA.items():
+            for name in [data['en'], *data.get('alias', [])]:
+                table[name] = emoji
+        return table
+
+
+def emojize(text: str) -> str:
+    """Equivalent to emoji.emojize(text, use_aliases=True), without
+    rebuilding anything per call or doing anything if there can't be any
+    shortcodes in the text to begin with"""
+    if ':' not in text:
+        return text
+    table = emoji_table()
+    return EMOJI_SHORTCODE.sub(
+        lambda match: table.get(match.group(1), match.group(1)),
+        text,
+    )
+
+
+@timed('format_irc_message')
 def format_irc_message(
     text: str,
     users: dict[str, Any],
     bots: dict[str, Any],
-    channels: dict[str, Any],
+    channels: Mapping[str, Any],
 ) -> str:
     """
     Replace channels, users, commands, links, emoji, and any remaining stuff in
@@ -88,7 +142,11 @@ def format_irc_message(
         """
         chan_id = match.group(1)
         readable = match.group(2)
-        return f'#{readable or channels[chan_id].get("name")}'
+        if readable:
+            return f'#{readable}'
+        channel = channels.get(chan_id)
+        # A channel the bridge hasn't heard of yet (created since it started)
+        return f'#{channel.name}' if channel is not None else f'#{chan_id}'
 
     def user_replace(match: Match[str]) -> str:
         """
@@ -128,7 +186,7 @@ def format_irc_message(
     text = re.sub(r'<\@(U\w+)\|?(\w+)?>', user_replace, text)
     text = re.sub(r'<!(\w+)\|?(\w+)?>', var_replace, text)
     text = re.sub(r'<(?!!)([^|]+?)>', lambda match: match.group(1), text)
-    text = emojize(text, use_aliases=True)
+    text = emojize(text)
     text = re.sub(r'<.+?\|(.+?)>', lambda match: match.group(1), text)
 
     # Slack gives <, >, and & as HTML-encoded entities, so we want to decode
@@ -137,7 +195,8 @@ def format_irc_message(
     return text
 
 
-def format_slack_message(text: str, users: dict[str, Any]) -> str:
+@timed('format_slack_message')
+def format_slack_message(text: str, slack_names: Collection[str]) -> str:
     """
     Strip any color codes coming from IRC, since Slack cannot display them
     The current solution is taken from https://stackoverflow.com/a/970723
@@ -156,9 +215,8 @@ def format_slack_message(text: str, users: dict[str, Any]) -> str:
         assuming no user has the display name "no-more" in the Workspace.
         """
         nick = match.group(1)
-        for user in users.values():
-            if nick == user.slack_name:
-                return f'<@{nick}>'
+        if nick in slack_names:
+            return f'<@{nick}>'
         return match.group(0)
 
     text = re.sub(r'\x03(?:\d{1,2}(?:,\d{1,2})?)?', '', text, flags=re.UNICODE)
@@ -169,11 +227,55 @@ def format_slack_message(text: str, users: dict[str, Any]) -> str:
     return text
 
 
-def slack_api(slack_client: SlackClient, *args: Any, **kwargs: Any) -> Any:
+def format_slack_post(
+    nick: str,
+    channel: str,
+    message: str,
+    slack_names: Collection[str],
+) -> dict[str, Any]:
+    """
+    The arguments to chat.postMessage for posting a message from an IRC user
+    to Slack. This doesn't depend on any other state, so it can be run from
+    any thread, and benchmarked on its own.
+    """
+    return {
+        'channel': channel,
+        'text': format_slack_message(message, slack_names),
+        'as_user': False,
+        'username': nick,
+        'icon_url': user_to_gravatar(nick),
+    }
+
+
+def default_irc_host() -> str:
+    """The IRC server to use for a bridge whose config doesn't set [irc]
+    host: production when running as nobody, the dev server otherwise"""
+    if getpass.getuser() == 'nobody':
+        return 'irc.ocf.berkeley.edu'
+    return 'dev-irc.ocf.berkeley.edu'
+
+
+class SlackAPIError(Exception):
+    """A Slack API call that didn't succeed"""
+
+
+def checked_slack_api(
+    slack_client: SlackClient,
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """Call the Slack API, raising SlackAPIError unless it succeeds. For use
+    while running, where one failed call shouldn't stop the bridge."""
     results = slack_client.api_call(*args, **kwargs)
-    if results['ok']:
-        return results
-    else:
-        log.err(f'Error calling Slack API: {results}')
+    if not results['ok']:
+        raise SlackAPIError(f'Error calling Slack API: {results}')
+    return results
+
+
+def slack_api(slack_client: SlackClient, *args: Any, **kwargs: Any) -> Any:
+    try:
+        return checked_slack_api(slack_client, *args, **kwargs)
+    except SlackAPIError as e:
+        log.err(str(e))
         # TODO: Handle this better than exiting
         sys.exit(1)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+import slackbridge.metrics as metrics
+from slackbridge.bots import BridgeBot
+from slackbridge.bots import LoopHandler
+from slackbridge.bridge import Bridge
+from slackbridge.history import MessageIndex
+from slackbridge.presence import PresenceManager
+
+
+class FakeSlackClient:
+    """Hands out one batch of RTM frames, then nothing"""
+
+    def __init__(self, frames: list[dict[str, Any]]):
+        self.frames = frames
+
+    def rtm_connect(self, **kwargs: Any) -> bool:
+        return True
+
+    def rtm_read(self) -> list[dict[str, Any]]:
+        frames, self.frames = self.frames, []
+        return frames
+
+
+@pytest.fixture
+def make_bot(monkeypatch: Any) -> Any:
+    # Don't start the RTM and queue loops, the tests call them directly
+    monkeypatch.setattr(LoopHandler, 'start_loop', lambda self: None)
+
+    def make_bot(frames: list[dict[str, Any]], name: str = '') -> BridgeBot:
+        bridge = Bridge(FakeSlackClient(frames), 'token', 'U0', name)
+        return BridgeBot(
+            bridge,
+            'slack-bridge',
+            'password',
+            PresenceManager(bridge.users),
+            MessageIndex(),
+        )
+    return make_bot
+
+
+def queued(bot: BridgeBot) -> list[dict[str, Any]]:
+    messages = []
+    while not bot.message_queue.empty():
+        messages.append(bot.message_queue.get().raw_message)
+    return messages
+
+
+def message(text: str, ts: str = '1.000001') -> dict[str, Any]:
+    return {
+        'type': 'message',
+        'channel': 'C1',
+        'user': 'U1',
+        'text': text,
+        'ts': ts,
+    }
+
+
+def test_channel_object_frames_are_passed_through(make_bot: Any) -> None:
+    # channel_created (like channel_joined, im_created, etc.) has the whole
+    # channel in "channel" rather than its id, and must not stop the rest of
+    # the batch from being read
+    channel_created = {
+        'type': 'channel_created',
+        'channel': {'id': 'C9', 'name': 'new', 'created': 1},
+        'event_ts': '1.000000',
+    }
+    bot = make_bot([channel_created, message('hello')])
+    bot.check_slack_rtm()
+    # Events without a ts are queued as of when they arrived, so they come
+    # out after the message
+    assert queued(bot) == [
+        message('hello'),
+        {'type': 'channel_created', 'channel': channel_created['channel']},
+    ]
+
+
+def test_duplicates_and_echoes_are_dropped(make_bot: Any) -> None:
+    bot = make_bot([
+        message('hello'),
+        message('hello'),
+        message('from IRC', ts='2.000001'),
+    ])
+    bot.bridge.posted_to_slack('C1', {'ok': True, 'ts': '2.000001'})
+    bot.check_slack_rtm()
+    assert queued(bot) == [message('hello')]
+
+
+def test_dropped_events_are_counted_per_bridge(make_bot: Any) -> None:
+    bot = make_bot([message('hello'), message('hello')], name='ocf')
+    bot.check_slack_rtm()
+    assert metrics.counters['ocf.rtm_duplicates_dropped'] == 1
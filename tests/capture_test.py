@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import Any
+from typing import Callable
+
+from twisted.internet import task
+
+from slackbridge import capture
+from slackbridge.capture import read_capture
+from slackbridge.capture import RTMRecorder
+from slackbridge.records import SlackChannel
+from slackbridge.records import SlackUser
+
+
+def test_close_stops_flushing(tmp_path: Any, monkeypatch: Any) -> None:
+    clock = task.Clock()
+    loops: list[task.LoopingCall] = []
+
+    def looping_call(f: Callable[[], Any]) -> task.LoopingCall:
+        loop = task.LoopingCall(f)
+        loop.clock = clock
+        loops.append(loop)
+        return loop
+
+    monkeypatch.setattr(capture, 'LoopingCall', looping_call)
+    monkeypatch.setattr(
+        capture.reactor,
+        'addSystemEventTrigger',
+        lambda *args: None,
+    )
+    path = str(tmp_path / 'capture.ndjson.gz')
+    recorder = RTMRecorder(
+        path,
+        [SlackUser('U1', 'alice', 'Alice')],
+        [SlackChannel('C1', 'general', members={'U1'})],
+    )
+    recorder.record({'type': 'message', 'channel': 'C1', 'ts': '1.0'})
+    clock.advance(5)
+    recorder.close()
+    # The reactor keeps running while shutting down gracefully, and flushing
+    # the closed file would fail
+    assert not loops[0].running
+    clock.advance(30)
+
+    header, events = read_capture(path)
+    assert header['channels'][0]['members'] == ['U1']
+    assert [event['ts'] for _, event in events] == ['1.0']
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import pytest
+
+from slackbridge.bridge import Bridge
+from slackbridge.factories import BridgeBotFactory
+from slackbridge.history import MessageIndex
+from slackbridge.policy import ChannelPolicy
+from slackbridge.policy import IGNORED
+from slackbridge.presence import PresenceManager
+from slackbridge.records import SlackChannel
+from slackbridge.utils import SlackAPIError
+
+
+def make_factory() -> BridgeBotFactory:
+    bridge = Bridge(None, 'token', 'U0')
+    bridge.channel_policy = ChannelPolicy([('secret', IGNORED)])
+    bridge.ignored_channels['C2'] = SlackChannel('C2', 'secret', num_members=2)
+    return BridgeBotFactory(
+        bridge,
+        'slack-bridge',
+        'password',
+        [SlackChannel('C1', 'general')],
+        [],
+        PresenceManager(bridge.users),
+        MessageIndex(),
+        'irc.example.com',
+    )
+
+
+def test_set_channel_policy_fetches_members_first() -> None:
+    factory = make_factory()
+    old_policy = factory.bridge.channel_policy
+
+    def fail(channel: SlackChannel) -> None:
+        raise SlackAPIError('ratelimited')
+
+    with pytest.raises(SlackAPIError):
+        factory.set_channel_policy(ChannelPolicy(), fail)
+    # Nothing changed, so the next reload can try again
+    assert factory.bridge.channel_policy is old_policy
+    assert set(factory.bridge.channels) == {'C1'}
+
+    def fetch(channel: SlackChannel) -> None:
+        channel.members.update({'U1', 'U2'})
+
+    factory.set_channel_policy(ChannelPolicy(), fetch)
+    assert set(factory.bridge.channels) == {'C1', 'C2'}
+    assert factory.bridge.channels['C2'].members == {'U1', 'U2'}
+    assert factory.bridge.channel_name_to_uid['secret'] == 'C2'
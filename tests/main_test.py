@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import Any
+
+from slackbridge.bridge import Bridge
+from slackbridge.main import fetch_im_channels
+
+
+class FakeSlackClient:
+    """Returns the given Web API responses in order"""
+
+    def __init__(self, responses: list[dict[str, Any]]):
+        self.responses = responses
+        self.calls: list[dict[str, Any]] = []
+
+    def api_call(self, method: str, **kwargs: Any) -> dict[str, Any]:
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
+
+
+def test_fetch_im_channels_follows_cursor() -> None:
+    sc = FakeSlackClient([
+        {
+            'ok': True,
+            'channels': [{'id': 'D1', 'user': 'U1'}],
+            'response_metadata': {'next_cursor': 'next'},
+        },
+        {
+            'ok': True,
+            'channels': [{'id': 'D2', 'user': 'U2'}],
+            'response_metadata': {'next_cursor': ''},
+        },
+    ])
+    bridge = Bridge(sc, 'token', 'U0')
+    fetch_im_channels(bridge)
+    assert bridge.im_channels == {'U1': 'D1', 'U2': 'D2'}
+    assert sc.calls[1]['cursor'] == 'next'
+
+
+def test_fetch_im_channels_without_scope() -> None:
+    # IM channels are opened as needed instead, so this isn't fatal
+    sc = FakeSlackClient([{'ok': False, 'error': 'missing_scope'}])
+    bridge = Bridge(sc, 'token', 'U0')
+    fetch_im_channels(bridge)
+    assert bridge.im_channels == {}
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from configparser import ConfigParser
+from typing import Any
+
+from slackbridge.reload import ConfigReloader
+
+
+def write_config(path: Any, delay: str) -> ConfigParser:
+    path.write_text(
+        f'[irc]\nhost = irc.example.com\n[tuning]\ndelay = {delay}\n',
+    )
+    conf = ConfigParser()
+    conf.read(str(path))
+    return conf
+
+
+def test_failed_handler_is_retried(tmp_path: Any) -> None:
+    path = tmp_path / 'slackbridge.conf'
+    reloader = ConfigReloader(str(path), write_config(path, '1'))
+    applied = []
+    fail = [True]
+
+    def apply_tuning(conf: ConfigParser) -> None:
+        if fail.pop():
+            raise ValueError('not this time')
+        applied.append(conf.get('tuning', 'delay'))
+
+    reloader.on_change(('tuning',), apply_tuning)
+    write_config(path, '2')
+    reloader.reload()
+    assert applied == []
+
+    # The file hasn't changed since, but the change was never applied
+    fail.append(False)
+    reloader.reload()
+    assert applied == ['2']
+
+    reloader.reload()
+    assert applied == ['2']
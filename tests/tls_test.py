@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import datetime
+from typing import Any
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from OpenSSL import SSL
+from twisted.internet.interfaces import IHandshakeListener
+from twisted.internet.protocol import Factory
+from twisted.internet.protocol import Protocol
+from twisted.internet.testing import StringTransport
+from twisted.protocols.tls import TLSMemoryBIOFactory
+from zope.interface import implementer
+
+from benchmarks.loadtest.certs import make_self_signed_cert
+from slackbridge.tls import SharedClientTLS
+
+
+@implementer(IHandshakeListener)
+class Client(Protocol):
+    verified = False
+
+    def handshakeCompleted(self) -> None:
+        self.verified = True
+
+
+def make_other_ca() -> bytes:
+    """A CA that has nothing to do with the server's certificate"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Other CA')])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.BasicConstraints(ca=True, path_length=None),
+            critical=True,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM)
+
+
+def connect(tls: SharedClientTLS, cert: str, key: str) -> bool:
+    """Do a TLS handshake in memory with a server using cert and key, and
+    return whether the client got through it"""
+    factory = TLSMemoryBIOFactory(
+        tls,
+        isClient=True,
+        wrappedFactory=Factory.forProtocol(Client),
+    )
+    client = factory.buildProtocol(None)
+    transport = StringTransport()
+    client.makeConnection(transport)
+
+    context = SSL.Context(SSL.TLS_METHOD)
+    context.use_certificate_file(cert)
+    context.use_privatekey_file(key)
+    server = SSL.Connection(context, None)
+    server.set_accept_state()
+
+    while transport.value() and not transport.disconnecting:
+        server.bio_write(transport.value())
+        transport.clear()
+        try:
+            server.do_handshake()
+        except SSL.Error:
+            pass
+        try:
+            client.dataReceived(server.bio_read(65536))
+        except SSL.WantReadError:
+            pass
+    return client.wrappedProtocol.verified
+
+
+def test_from_ca_file_trusts_every_certificate(tmp_path: Any) -> None:
+    cert, key = make_self_signed_cert(str(tmp_path))
+    other_ca = tmp_path / 'other.pem'
+    other_ca.write_bytes(make_other_ca())
+    # The server's CA comes after another one in the bundle
+    bundle = tmp_path / 'bundle.pem'
+    with open(cert, 'rb') as f:
+        bundle.write_bytes(other_ca.read_bytes() + f.read())
+
+    tls = SharedClientTLS.from_ca_file('localhost', str(bundle))
+    assert connect(tls, cert, key)
+    tls = SharedClientTLS.from_ca_file('localhost', str(other_ca))
+    assert not connect(tls, cert, key)
+
+
+def test_from_ca_file_without_certificates(tmp_path: Any) -> None:
+    empty = tmp_path / 'empty.pem'
+    empty.write_bytes(b'')
+    with pytest.raises(ValueError):
+        SharedClientTLS.from_ca_file('localhost', str(empty))
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from slackbridge.bridge import Bridge
+from slackbridge.records import SlackChannel
+from slackbridge.utils import format_irc_message
+
+
+def test_format_channel_mentions() -> None:
+    bridge = Bridge(None, 'token', 'U0')
+    bridge.set_channels([SlackChannel('C1', 'general')])
+    bridge.ignored_channels['C2'] = SlackChannel('C2', 'secret')
+
+    def format(text: str) -> str:
+        return format_irc_message(
+            text,
+            bridge.users,
+            bridge.bots,
+            bridge.known_channels,
+        )
+
+    assert format('see <#C1|>') == 'see #general'
+    assert format('see <#C1|announce>') == 'see #announce'
+    # Channels that aren't bridged are still named, and ones the bridge
+    # doesn't know about are shown by id
+    assert format('see <#C2|>') == 'see #secret'
+    assert format('see <#C3>') == 'see #C3'